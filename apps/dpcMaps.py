@@ -0,0 +1,84 @@
+"""
+Script which builds differential phase contrast (DPC) maps for a list
+of scans, and writes the deflection and phase maps to one hdf5 file per
+scan. Example:
+
+    dpcMaps.py contrast_scan merlin 12 13 14 --psize 55e-6 --distance 1.5 \
+        --energy 10 --opt path=/data/.../raw/sample --mask mask.npy
+"""
+
+import nmutils
+import h5py
+import numpy as np
+import os, ast, argparse
+
+### Parse input
+parser = argparse.ArgumentParser(
+    description='This script builds DPC maps from the 2D data of a list of scans.',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('scan_class', type=str,
+                    help='The nmutils.core Scan subclass used to load the data.')
+parser.add_argument('data_source', type=str,
+                    help='The dataSource option of the 2D data to use.')
+parser.add_argument('scans', type=int, nargs='+',
+                    help='The scan numbers to process.')
+parser.add_argument('--opt', type=str, dest='opts', action='append', default=[],
+                    help='Further loader options as key=value, for example path=/some/folder or xrdCropping=[0,100,0,100]. Can be repeated.')
+parser.add_argument('--psize', type=float, dest='psize', default=55e-6,
+                    help='Detector pixel size (m).')
+parser.add_argument('--distance', type=float, dest='distance', default=1.,
+                    help='Sample-detector distance (m).')
+parser.add_argument('--energy', type=float, dest='energy', default=None,
+                    help='Photon energy (keV), needed for the phase map.')
+parser.add_argument('--mask', type=str, dest='mask', default=None,
+                    help='Detector mask as a .npy file, True for pixels to exclude.')
+parser.add_argument('--flip', type=str, dest='flip', default='', choices=['', 'x', 'y', 'xy'],
+                    help='Flip the sign of the deflections along these scan directions.')
+parser.add_argument('--oversampling', type=int, dest='oversampling', default=1,
+                    help='Map oversampling relative to the average step size.')
+parser.add_argument('--workers', type=int, dest='workers', default=0,
+                    help='Number of threads for the center of mass calculation, 0 for one per core.')
+parser.add_argument('--output_folder', type=str, dest='output_folder', default='.',
+                    help='Output folder.')
+args = parser.parse_args()
+
+### Loader options
+opts = {'dataSource': args.data_source}
+for opt in args.opts:
+    key, value = opt.split('=', 1)
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    opts[key] = value
+mask = None if args.mask is None else np.load(args.mask).astype(bool)
+signs = (-1 if 'x' in args.flip else 1, -1 if 'y' in args.flip else 1)
+if not os.path.exists(args.output_folder):
+    os.makedirs(args.output_folder)
+
+### Do the work
+for scanNr in args.scans:
+    print('*** Building DPC maps for scan %u' % scanNr)
+    scan = getattr(nmutils.core, args.scan_class)()
+    if 'scanNr' in scan.default_opts:
+        opts['scanNr'] = scanNr
+    try:
+        scan.addData(name='2d', **opts)
+    except nmutils.NoDataException as e:
+        print('skipping scan %u: %s' % (scanNr, e))
+        continue
+    dpc = nmutils.core.dpcMaps(scan, name='2d', psize=args.psize, distance=args.distance,
+                               energy=args.energy, mask=mask, signs=signs,
+                               oversampling=args.oversampling, nWorkers=args.workers)
+    output_file = os.path.join(args.output_folder, 'dpc_%06u.h5' % scanNr)
+    with h5py.File(output_file, 'w') as fp:
+        for key in ('x', 'y', 'dx', 'dy', 'opd', 'phase'):
+            if dpc[key] is not None:
+                fp[key] = dpc[key]
+        fp['com'] = dpc['com']
+        fp['positions'] = scan.positions
+        fp.attrs['psize'] = args.psize
+        fp.attrs['distance'] = args.distance
+        if args.energy is not None:
+            fp.attrs['energy'] = args.energy
+    print('wrote %s' % output_file)
@@ -13,17 +13,16 @@ scan_numbers = range(2, 32+1) # to 32
 #scan_numbers = (2, 6, 10, 14, 18) # to 32
 #scan_numbers = (14,)
 
-# loop through these and load the data, merging them together after each
-for i, n in enumerate(scan_numbers):
+# loop through these and load the data, collecting them in a MultiScan
+# which presents them as one scan without copying the data
+scan = nmutils.core.MultiScan()
+for n in scan_numbers:
 	new = nmutils.core.flyscan_nov2018()
 	new.addData(dataSource='xspress3', normalize_by_I0=True, globalPositions=True,
 		fileName='/data/staff/nanomax/commissioning_2019-1/20190415_Vajda/raw/sphere-1/sphere-1.h5',
 		#fileName='/home/alex/tmp/sphere-1/sphere-1.h5',
 		scanNr=n, name='1d', xrfCropping=[0,1800])
-	if i == 0:
-		scan = new
-		continue
-	scan.merge(new)	
+	scan.merge(new)
 
 # create the ScanViewer instance, do some qt magic that you always need,
 # and pass the loaded data to the viewer.
@@ -0,0 +1,49 @@
+"""
+Example script which exports a scan with each of the export profiles
+(see nmutils.core.EXPORT_PROFILES) and times writing the file,
+reading it frame by frame, and reading single-pixel maps and spectra.
+"""
+
+import nmutils
+import numpy as np
+import h5py
+import time
+import os
+
+# load some data, here a scan with 2D and 1D data
+scan = nmutils.core.contrast_scan()
+path = '/data/visitors/nanomax/20200364/2020100708/raw/sample'
+scan.addData(name='2d', dataSource='eiger', scanNr=12, path=path)
+scan.addData(name='1d', dataSource='xspress3', scanNr=12, path=path)
+
+# export profiles, with an extra compressed variant if hdf5plugin is there
+profiles = [(name, None) for name in nmutils.core.EXPORT_PROFILES.keys()]
+if nmutils.core.HAS_HDF5PLUGIN:
+    profiles += [('frame-wise', 'bitshuffle'), ('map-wise', 'zstd')]
+
+outdir = '/tmp'
+for profile, compression in profiles:
+    fn = os.path.join(outdir, 'export_%s_%s.h5' % (profile, compression))
+    if os.path.exists(fn):
+        os.remove(fn)
+    t0 = time.time()
+    scan.export(fn, method='reshape', profile=profile, compression=compression)
+    t_write = time.time() - t0
+
+    with h5py.File(fn, 'r') as fp:
+        frames = fp['entry0/data/2d']
+        spectra = fp['entry0/data/1d']
+        # read some frames
+        t0 = time.time()
+        for i in range(min(20, frames.shape[0])):
+            frames[i, 0]
+        t_frames = time.time() - t0
+        # read a map of a single detector pixel and a single channel
+        t0 = time.time()
+        frames[..., frames.shape[-2] // 2, frames.shape[-1] // 2]
+        spectra[..., spectra.shape[-1] // 2]
+        t_maps = time.time() - t0
+
+    size = os.path.getsize(fn) / 2**20
+    print('%-12s %-12s write %6.2f s, frames %6.3f s, pixel maps %6.3f s, %8.1f MB'
+          % (profile, compression, t_write, t_frames, t_maps, size))
@@ -0,0 +1,164 @@
+"""
+Implements the MultiScan class, which presents a number of Scan objects
+as one scan without copying their data.
+"""
+
+import numpy as np
+import copy as cp
+from collections.abc import MutableMapping
+
+from .Scan import Scan
+from .lazy import LazyArray, LazyConcatenation
+
+__docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
+
+
+class _MultiData(MutableMapping):
+    """
+    The data dict of a MultiScan. Datasets are lazy concatenations of the
+    member datasets, built on access and cached until the members change.
+    """
+
+    def __init__(self, multi):
+        self.multi = multi
+
+    def __getitem__(self, key):
+        views = self.multi._views
+        if key not in views:
+            scans = self.multi.scans
+            if not scans or key not in scans[0].data:
+                raise KeyError(key)
+            if len(scans) == 1:
+                views[key] = scans[0].data[key]
+            else:
+                views[key] = LazyConcatenation([s.data[key] for s in scans])
+        return views[key]
+
+    def __setitem__(self, key, value):
+        """
+        Splits a dataset spanning all positions over the member scans.
+        """
+        assert len(value) == self.multi.nPositions
+        offsets = self.multi._offsets()
+        for i, s in enumerate(self.multi.scans):
+            a, b = offsets[i], offsets[i + 1]
+            if isinstance(value, LazyArray):
+                s.data[key] = value.take(np.arange(a, b))
+            else:
+                s.data[key] = value[a:b]
+        self.multi._views.pop(key, None)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        for s in self.multi.scans:
+            del s.data[key]
+        self.multi._views.pop(key, None)
+
+    def __iter__(self):
+        scans = self.multi.scans
+        return iter(scans[0].data.keys() if scans else ())
+
+    def __len__(self):
+        scans = self.multi.scans
+        return len(scans[0].data) if scans else 0
+
+
+class MultiScan(Scan):
+    """
+    Container which keeps references to a number of member scans and
+    presents them as a single scan. The data of the members is indexed
+    through lazy concatenations, so merging is O(1) and nothing is
+    copied until materialize() is called or the data is read.
+
+    scan = MultiScan()
+    for n in scan_numbers:
+        new = contrast_scan()
+        new.addData(...)
+        scan.merge(new)
+    """
+
+    def __init__(self, scans=()):
+        self.scans = []
+        self._views = {}
+        self._positions = None
+        super(MultiScan, self).__init__()
+        for scan in scans:
+            self.merge(scan)
+
+    @property
+    def data(self):
+        return _MultiData(self)
+
+    @data.setter
+    def data(self, value):
+        if value:
+            raise AttributeError('MultiScan data is defined by the member scans')
+
+    @property
+    def positions(self):
+        if self._positions is None and self.scans:
+            self._positions = np.concatenate([s.positions for s in self.scans], axis=0)
+        return self._positions
+
+    @positions.setter
+    def positions(self, value):
+        if value is not None:
+            raise AttributeError('MultiScan positions are defined by the member scans')
+
+    def _offsets(self):
+        return np.cumsum([0] + [s.nPositions for s in self.scans])
+
+    def _prepareData(self, **kwargs):
+        raise TypeError('Load data into the member scans and merge them instead')
+
+    def merge(self, scanobj):
+        """
+        Adds another Scan object as a member, without copying its data.
+        The scans must have the same datasets.
+        """
+        if isinstance(scanobj, MultiScan):
+            for scan in scanobj.scans:
+                self.merge(scan)
+            return
+        if self.scans:
+            assert self.scans[0].data.keys() == scanobj.data.keys()
+        else:
+            # the first member provides the metadata
+            self.positionDimLabels = scanobj.positionDimLabels
+            self.dataTitles = scanobj.dataTitles
+            self.dataDimLabels = scanobj.dataDimLabels
+            self.dataAxes = scanobj.dataAxes
+        self.scans.append(scanobj)
+        self._views = {}
+        self._positions = None
+
+    def copy(self, data=True):
+        """
+        Returns a plain Scan instance with the metadata and (with
+        data=True) copies of the combined positions and data, still lazy
+        where the member data are lazy.
+        """
+        new = Scan()
+        for key in self.__dict__.keys():
+            if key not in ['scans', '_views', '_positions', '_cache']:
+                setattr(new, key, cp.deepcopy(getattr(self, key)))
+        if data:
+            new.positions = self.positions.copy()
+            for key in self.data.keys():
+                new.data[key] = cp.deepcopy(self.data[key])
+        else:
+            for key in self.data.keys():
+                new.data[key] = None
+        return new
+
+    def materialize(self):
+        """
+        Returns a plain Scan instance where all the member data has been
+        read and concatenated into numpy arrays.
+        """
+        new = self.copy(data=False)
+        new.positions = self.positions.copy()
+        for key in self.data.keys():
+            new.data[key] = np.array(self.data[key])
+        return new
@@ -9,14 +9,46 @@ import numpy as np
 import h5py
 import copy as cp
 import os.path
+import contextlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from .. import NoDataException
+from .lazy import LazyArray, LazyDataset, LazyConcatenation, chunkSlices, CHUNK_BYTES
+from .cache import DataCache
+from .reducers import MaskedSum
 
 import scipy.ndimage.measurements
-from scipy.interpolate import griddata
+import scipy.sparse
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import cKDTree, Delaunay
 from functools import reduce
+from collections import namedtuple
 
 __docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
 
+# A regular scanning grid, as detected by Scan.detectGrid(). index is an
+# (Nlines x Npoints) array of position indices, -1 where a position is
+# missing, with the lines in scan order and the points in the order of
+# the first line. fast is the dimension (0 or 1) scanned along the lines,
+# and points and lines are the fast and slow coordinates of the grid.
+ScanGrid = namedtuple('ScanGrid', ['index', 'fast', 'points', 'lines'])
+
+# Named profiles for Scan.export(), giving the chunk layout and the
+# compression of the data. The chunk layouts are
+#   'default' - the 4 MiB heuristic of Scan._calcChunkSize
+#   'frame'   - whole frames per chunk, for reading frame by frame
+#   'map'     - whole maps of a few data channels per chunk, for reading
+#               maps or the spectrum of single pixels
+# and the compression is 'lzf', 'gzip', 'bitshuffle' (with LZ4),
+# 'blosc', 'zstd' or 'none', where the last three need hdf5plugin.
+# level None means the default level of the filter.
+EXPORT_PROFILES = {
+    'default':    {'chunks': 'default', 'compression': 'lzf', 'level': None},
+    'frame-wise': {'chunks': 'frame', 'compression': 'lzf', 'level': None},
+    'map-wise':   {'chunks': 'map', 'compression': 'lzf', 'level': None},
+    'fast-write': {'chunks': 'frame', 'compression': 'none', 'level': None},
+}
+
 
 class Scan(object):
 
@@ -32,6 +64,15 @@ class Scan(object):
             }
     }
 
+    # Options which determine the positions. Within an addDatasets()
+    # call, positions aren't read again for datasets where these are
+    # unchanged. Empty means positions are always read.
+    positionOpts = ()
+
+    # Options which don't change the data, and so are left out of the
+    # disk cache keys (see cache.py and the 'cache' loader option).
+    cacheIgnore = ('cache', 'lazy', 'nWorkers', 'workerType')
+
     def __init__(self):
         """ 
         Only initializes counters and containers. Parameters, positions
@@ -41,7 +82,8 @@ class Scan(object):
         # A dict of datasets, where each value is an array, the first
         # index of which is the position, so (Npositions x M x N) or
         # (Npositions x M) for example. Each dataset can have different
-        # dimensionality.
+        # dimensionality. Datasets can also be lazy array-like objects
+        # (see lazy.py) which read from disk on demand.
         self.data = {}
 
         # An array of scanning positions (Npositions x Ndimensions),
@@ -56,6 +98,14 @@ class Scan(object):
         self.dataDimLabels = {}     # labels for each of the data dimensions
         self.dataAxes = {}          # numerical values for the axes of each dataset
 
+        # Derived quantities like interpolation weights, see _cached().
+        # Not copied along with the scan.
+        self._cache = {}
+
+        # Open files and memoized values shared between the datasets of
+        # an addDatasets() call, None otherwise.
+        self._session = None
+
     @property
     def nDatasets(self):
         return len(self.data)
@@ -181,12 +231,110 @@ class Scan(object):
         if not name:
             name = 'data%u' % self.nDatasets
 
+        self.data[name] = self._loadData(name, **kwargs)
+
+    def addDatasets(self, datasets, skipMissing=False, skipMemoryError=False, **common):
+        """
+        Adds several datasets in one pass, where files are opened once
+        and kept open, and positions and values like I0 are read once
+        and shared between the datasets.
+
+        datasets:    dict of {name: kwargs}, where the kwargs are as for
+                     addData() and take precedence over common
+        skipMissing: skip datasets which raise NoDataException rather
+                     than failing
+        skipMemoryError: skip datasets which don't fit in memory rather
+                     than failing, so that the others are still loaded
+        common:      kwargs shared by all the datasets
+
+        Returns the names of the datasets added.
+
+        scan.addDatasets({'2d': {'dataSource': 'eiger'},
+                          '1d': {'dataSource': 'xspress3'}},
+                         path=path, scanNr=12)
+        """
+        added = []
+        self._session = {'files': {}, 'memo': {}}
+        try:
+            for name, opts in datasets.items():
+                kwargs = dict(common)
+                kwargs.update(opts)
+                try:
+                    self.addData(name=name, **kwargs)
+                except NoDataException:
+                    if not skipMissing:
+                        raise
+                    print("no data found for '%s', skipping" % name)
+                    continue
+                except MemoryError:
+                    if not skipMemoryError:
+                        raise
+                    print("out of memory loading '%s', skipping. Consider cropping or binning the data" % name)
+                    continue
+                added.append(name)
+        finally:
+            for fp in self._session['files'].values():
+                fp.close()
+            self._session = None
+        return added
+
+    def _open(self, fileName):
+        """
+        Opens an hdf5 file for reading, for use as a context manager.
+        Within addDatasets() the file is kept open and shared.
+        """
+        if self._session is None:
+            return h5py.File(fileName, 'r')
+        files = self._session['files']
+        key = os.path.abspath(fileName)
+        if key not in files:
+            files[key] = h5py.File(fileName, 'r')
+        return contextlib.nullcontext(files[key])
+
+    def _memoized(self, key, build):
+        """
+        Returns build(), which within addDatasets() is only called once
+        for each key.
+        """
+        if self._session is None:
+            return build()
+        memo = self._session['memo']
+        if key not in memo:
+            memo[key] = build()
+        return memo[key]
+
+    def _loadData(self, name, **kwargs):
+        """
+        Does the work for addData(), reading positions if needed and
+        returning the dataset without storing it.
+        """
+
         self._prepareData(**kwargs)
 
+        # processed data might be in the disk cache already
+        cache, key, cached = DataCache(), self._cacheKey(kwargs), None
+        if key:
+            cached = cache.load(key)
+        positionKey = tuple(getattr(self, k) for k in self.positionOpts)
+        if cached:
+            print("loading '%s' from the cache" % name)
+            arrays, meta = cached
+            positions = np.array(arrays['positions'])
+        elif (self.nDatasets and self.positionOpts and self._session is not None
+              and self._session.get('positionKey') == positionKey):
+            # already read with the same options in this addDatasets() call
+            positions = self.positions
+        else:
+            positions = self._readPositions()
+            if self._session is not None:
+                self._session['positionKey'] = positionKey
+
         # Check if any data exists.
         if not self.nDatasets:
             # initialize data dict and read positions
-            self.positions = self._readPositions()
+            self.positions = positions
+            if cached:
+                self.positionDimLabels = meta['positionDimLabels']
             if not self.positionDimLabels:
                 self.positionDimLabels = ['scan direction %d' % i for i in range(1, self.nDimensions+1)]
         else:
@@ -194,13 +342,20 @@ class Scan(object):
             if name in self.data.keys():
                 raise ValueError("Dataset '%s' already exists!" % name)
             # verify that positions are are consistent
-            if not np.all(self.positions == self._readPositions()):
+            if not np.all(self.positions == positions):
                 raise ValueError(
                     "Positions of new dataset are inconsistent with previously loaded positions!")
 
         # The actual reading is done by _readData() which knows about the
         # details of the hdf5 file
-        data = self._readData(name)
+        if cached:
+            data = arrays['data']
+            self._setCacheMeta(name, meta)
+        else:
+            data = self._readData(name)
+            if key and not isinstance(data, LazyArray):
+                cache.store(key, {'data': data, 'positions': positions},
+                            self._getCacheMeta(name))
 
         # Check if _readData has filled in the info fields, otherwise generate something
         if self.dataTitles.get(name) is None:
@@ -217,17 +372,163 @@ class Scan(object):
         if data.shape[0] < self.nPositions:
             missing = self.nPositions - data.shape[0]
             print("there were %d missing images for dataset '%s', filling with average values"%(missing, name))
-            pads = ((0, missing),) + ((0, 0),) * (data.ndim - 1)
-            data = np.pad(data, pads, mode='mean')
+            if isinstance(data, LazyArray):
+                data = data.take(np.concatenate((np.arange(data.shape[0]), -np.ones(missing, dtype=int))))
+            else:
+                pads = ((0, missing),) + ((0, 0),) * (data.ndim - 1)
+                data = np.pad(data, pads, mode='mean')
 
         # remove data in case too much has been returned
         if data.shape[0] > self.nPositions:
             excess = data.shape[0] - self.nPositions
             print("there were %d too many images for dataset '%s', ignoring"%(excess, name))
-            data = data[:self.nPositions]
+            if isinstance(data, LazyArray):
+                data = data.take(np.arange(self.nPositions))
+            else:
+                data = data[:self.nPositions]
 
-        self.data[name] = data
+        return data
         
+    def _cacheSources(self):
+        """
+        The files which the data of the current options are made from,
+        used to tell whether cached data is still valid. Loaders with
+        data in other files than fileName override this, and can return
+        None for data which shouldn't be cached.
+        """
+        return [self.fileName]
+
+    def _cacheKey(self, kwargs):
+        """
+        Returns the disk cache key for the data described by the addData
+        kwargs, or None if the loader shouldn't use the cache. Caching is
+        enabled by a 'cache' option on the loader.
+        """
+        if not getattr(self, 'cache', False):
+            return None
+        sources = self._cacheSources()
+        if not sources:
+            return None
+        opts = self._updateOpts(cp.deepcopy(self.default_opts), **kwargs)
+        opts = {k: dct['value'] for k, dct in opts.items() if k not in self.cacheIgnore}
+        return DataCache().key(sources, self.__class__, opts)
+
+    def _getCacheMeta(self, name):
+        """ The metadata which _readData has set, as json-able values. """
+        axes = self.dataAxes.get(name)
+        return {
+            'positionDimLabels': self.positionDimLabels,
+            'title': self.dataTitles.get(name),
+            'dimLabels': self.dataDimLabels.get(name),
+            'axes': None if axes is None else [np.asarray(a).tolist() for a in axes],
+            }
+
+    def _setCacheMeta(self, name, meta):
+        """ Restores what _readData would have set from cached metadata. """
+        if meta['title'] is not None:
+            self.dataTitles[name] = meta['title']
+        if meta['dimLabels'] is not None:
+            self.dataDimLabels[name] = meta['dimLabels']
+        if meta['axes'] is not None:
+            self.dataAxes[name] = [np.array(a) for a in meta['axes']]
+
+    def reduce(self, name, reducers, chunk=None, nWorkers=1, **kwargs):
+        """
+        Reduces a dataset to scalar (0d) datasets in a single streaming
+        pass, so that only one chunk of positions is in memory at a time.
+        Only the union of the regions needed by the reducers is read.
+
+        name:     the dataset to reduce. If it isn't loaded, the kwargs
+                  are passed on to the loader as for addData(), the data
+                  is read lazily (unless lazy=False is passed) if the
+                  loader supports it, and the frames are not kept. The
+                  positions are loaded too, and set on the scan if it
+                  has none, or else have to match the existing ones.
+        reducers: a Reducer object or a list of them, see reducers.py
+        chunk:    number of positions per chunk, by default some 64 MiB
+                  worth of frames, or of the working copies of reducers
+                  which convert the frames (see Reducer.workItemsize)
+        nWorkers: number of chunks reduced in parallel threads, 0 means
+                  one per CPU core
+
+        Returns a dict of arrays with one value (or one row of values,
+        for reducers like CenterOfMass) per position, keyed by the
+        reducer names.
+        """
+        try:
+            reducers = list(reducers)
+        except TypeError:
+            reducers = [reducers]
+        names = [r.name or 'reduced%u' % i for i, r in enumerate(reducers)]
+        if len(set(names)) != len(names):
+            raise ValueError('Reducer names have to be unique')
+
+        if name in self.data.keys():
+            data = self.data[name]
+        else:
+            if 'lazy' in self.default_opts.keys():
+                kwargs.setdefault('lazy', True)
+            positions = self.positions
+            try:
+                data = self._loadData(name, **kwargs)
+            finally:
+                # the frames aren't kept, so neither is their metadata
+                for meta in (self.dataTitles, self.dataDimLabels, self.dataAxes):
+                    meta.pop(name, None)
+            if positions is not None and not (positions.shape == self.positions.shape
+                                              and np.all(positions == self.positions)):
+                self.positions = positions
+                raise ValueError(
+                    "Positions of dataset '%s' are inconsistent with the existing positions!" % name)
+
+        # the union of all regions, as a tuple of slices
+        frameShape = data.shape[1:]
+        if any(r.region is None for r in reducers):
+            box = tuple(slice(0, n) for n in frameShape)
+        else:
+            box = tuple(slice(min(r.region[d].start for r in reducers),
+                              max(r.region[d].stop for r in reducers))
+                        for d in range(len(frameShape)))
+        if isinstance(data, LazyDataset):
+            data = data.cropped(box)
+            key = ()
+        else:
+            key = box
+
+        # stream through the data
+        n = data.shape[0]
+        if chunk is None:
+            chunk = data.chunkPositions if isinstance(data, LazyArray) \
+                else max(1, CHUNK_BYTES // max(1, data[0].nbytes))
+            # shrink the chunks for reducers which work on wider copies
+            itemsize = np.dtype(data.dtype).itemsize
+            workItemsize = max([r.workItemsize or 0 for r in reducers] + [itemsize])
+            chunk = max(1, chunk * itemsize // workItemsize)
+        def work(sl):
+            block = data[(sl,) + key]
+            return sl, [r.reduce(block, box) for r in reducers]
+
+        results = {}
+        def store(sl, values):
+            for nm, value in zip(names, values):
+                if nm not in results:
+                    results[nm] = np.empty((n,) + np.shape(value)[1:], dtype=np.float64)
+                results[nm][sl] = value
+
+        slices = list(chunkSlices(n, chunk))
+        nWorkers = min(nWorkers or os.cpu_count() or 1, len(slices))
+        if nWorkers <= 1:
+            for sl in slices:
+                store(*work(sl))
+        else:
+            with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+                for sl, values in pool.map(work, slices):
+                    store(sl, values)
+        for nm in names:
+            if nm not in results:
+                results[nm] = np.empty(0, dtype=np.float64)
+        return results
+
     def removeData(self, name):
         if name in list(self.data.keys()):
             self.data.pop(name, None)
@@ -247,6 +548,111 @@ class Scan(object):
                     "There is more than one dataset to choose from. Please specify!")
         return np.mean(self.data[name], axis=0)
 
+    def spectralIndex(self, name='1d'):
+        """
+        Returns the prefix sums of a 1D dataset along its channel axis,
+        as a (channels+1 x positions) float64 array where row i holds
+        the sum over channels [0, i) of each position, so that any
+        channel window costs one subtraction per position, see
+        windowSums(). The index is built in one streaming pass (lazy
+        data is read chunk by chunk) the first time it's needed, and
+        again when the dataset is replaced, but not when it's changed
+        in place.
+        """
+        data = self.data[name]
+        assert len(data.shape) == 2
+
+        def build():
+            n, nChannels = data.shape
+            index = np.empty((nChannels + 1, n), dtype=np.float64)
+            index[0] = 0.
+            if isinstance(data, LazyArray):
+                chunk = data.chunkPositions
+            else:
+                chunk = max(1, CHUNK_BYTES // max(1, 8 * nChannels))
+            # the transposed output is written in cache-sized blocks
+            block = max(16, 2**17 // max(1, nChannels))
+            for sl in chunkSlices(n, chunk):
+                frames = data[sl]
+                for b in chunkSlices(len(frames), block):
+                    out = index[1:, sl.start + b.start:sl.start + b.stop].T
+                    np.cumsum(frames[b], axis=1, dtype=np.float64, out=out)
+            # keep the data itself, so that its id isn't reused
+            return data, index
+
+        key = (name, id(data), data.shape)
+        return self._cached('spectralIndex', key, build, maxsize=2)[1]
+
+    def windowSums(self, windows, name='1d', mean=False):
+        """
+        Returns the sums (or means) over channel windows of a 1D dataset
+        for all positions, using the spectralIndex(). A window is a pair
+        of channels (lower, upper), covering lower:upper as in slicing.
+        A single window gives one value per position, and a list of
+        windows a (positions x windows) array. Empty windows give 0, or
+        NaN for the mean.
+        """
+        index = self.spectralIndex(name)
+        single = (np.ndim(windows) == 1)
+        windows = np.atleast_2d(windows).astype(int)
+        lower = np.clip(windows[:, 0], 0, index.shape[0] - 1)
+        upper = np.clip(windows[:, 1], lower, index.shape[0] - 1)
+        sums = (index[upper] - index[lower]).T
+        if mean:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sums /= (upper - lower)
+        return sums[:, 0] if single else sums
+
+    # the longest chain of incremental maskSums() updates before the
+    # sums are worked out from scratch again
+    maxMaskChain = 8
+
+    def maskSums(self, mask, name='2d', mean=False):
+        """
+        Returns the sum (or mean) over the pixels of a frame-shaped
+        boolean mask for all positions, see the MaskedSum reducer. The
+        results are cached per mask, and a new mask is worked out from
+        the cached mask it differs least from, by reducing only over the
+        pixels added and removed. So adding a stroke to a mask only
+        reads the pixels of the stroke. After maxMaskChain such updates
+        in a row, the sums are recomputed from scratch so that rounding
+        errors don't build up. An empty mask gives 0, or NaN for the
+        mean.
+        """
+        data = self.data[name]
+        mask = np.asarray(mask, dtype=bool)
+        assert mask.shape == tuple(data.shape[1:])
+        dataKey = (name, id(data), data.shape)
+        cache = self._cache.get('maskSums', {})
+
+        def build():
+            # start from the cached mask with the fewest changed pixels,
+            # if that beats reducing over the whole mask
+            base, cost = None, np.count_nonzero(mask)
+            for key, (m, d, sums, chain) in cache.items():
+                if key[0] == dataKey and chain < self.maxMaskChain:
+                    changed = np.count_nonzero(m != mask)
+                    if changed < cost:
+                        base, cost = (m, sums, chain + 1), changed
+            if base is None:
+                base = (np.zeros_like(mask), np.zeros(data.shape[0]), 0)
+            m, sums, chain = base
+            reducers = [MaskedSum(part, name=nm) for nm, part in
+                        (('added', mask & ~m), ('removed', m & ~mask)) if part.any()]
+            if reducers:
+                results = self.reduce(name, reducers)
+                sums = sums + results.get('added', 0.) - results.get('removed', 0.)
+            # keep the data itself, so that its id isn't reused
+            return mask.copy(), data, sums, chain
+
+        # the packed mask is small enough to be the key itself
+        key = (dataKey, np.packbits(mask).tobytes())
+        sums = self._cached('maskSums', key, build, maxsize=8)[2]
+        if mean:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return sums / np.count_nonzero(mask)
+        return sums
+
     def copy(self, data=True):
         """ 
         Returns a copy of the Scan instance. The kwarg data can be set
@@ -256,9 +662,9 @@ class Scan(object):
         updated.
         """
 
-        # copy all
+        # copy all but the cache
         if data:
-            return cp.deepcopy(self)
+            return cp.deepcopy(self, memo={id(self._cache): {}})
 
         # otherwise, construct a new objects and copy all the attributes
         # create a new object of the right subclass:
@@ -266,7 +672,7 @@ class Scan(object):
 
         # copy all the non-data attributes
         for key in self.__dict__.keys():
-            if key not in ['data', 'positions']:
+            if key not in ['data', 'positions', '_cache']:
                 exec("new.%s = cp.deepcopy(self.%s)" % (key, key))
         for dataset in self.data.keys():
             new.data[dataset] = None
@@ -276,72 +682,198 @@ class Scan(object):
     def merge(self, scanobj):
         """
         Adds positions and data from another Scan object. The scans must
-        have the same datasets.
+        have the same datasets. Lazy datasets are concatenated without
+        reading them.
         """
         assert self.data.keys() == scanobj.data.keys()
         self.positions = np.concatenate((self.positions, scanobj.positions), axis=0)
         for key in self.data.keys():
-            self.data[key] = np.concatenate((self.data[key], scanobj.data[key]), axis=0)
+            if isinstance(self.data[key], LazyArray) or isinstance(scanobj.data[key], LazyArray):
+                self.data[key] = LazyConcatenation((self.data[key], scanobj.data[key]))
+            else:
+                self.data[key] = np.concatenate((self.data[key], scanobj.data[key]), axis=0)
+
+    @classmethod
+    def fromExport(cls, filepath, lazy=True):
+        """
+        Opens a file written by export() as a Scan, with positions,
+        datasets and metadata restored. With lazy=True the datasets stay
+        on disk and are read on demand, see the exported_scan loader.
+        """
+        from .exported import exported_scan
+        scan = exported_scan()
+        names = exported_scan.datasetNames(filepath)
+        scan.addDatasets({name: {'dataset': name} for name in names},
+                         fileName=filepath, lazy=lazy)
+        return scan
+
+    def selectPositions(self, posRange=None, polygon=None, center=None, radius=None):
+        """
+        Returns a boolean mask over the positions, True for those which
+        satisfy all the given criteria:
+
+        posRange: array([[xmin, ymin, ...], [xmax, ymax, ...]]), limits
+                  inclusive
+        polygon:  sequence of (x, y) vertices, tested against the first
+                  two position dimensions
+        center, radius: a circle (or sphere) around the point center
+        """
+        mask = np.ones(self.nPositions, dtype=bool)
+        if posRange is not None:
+            posRange = np.asarray(posRange)
+            mask &= np.all((self.positions >= posRange[0])
+                           & (self.positions <= posRange[1]), axis=1)
+        if polygon is not None:
+            mask &= self._insidePolygon(self.positions[:, :2], polygon)
+        if center is not None:
+            # using sum instead of linalg.norm here, for old numpy at beamline:
+            mask &= (np.sum((self.positions - center)**2, axis=1) <= radius**2)
+        return mask
+
+    @staticmethod
+    def _insidePolygon(points, polygon):
+        """
+        Even-odd (ray casting) test of which of the (N, 2) points lie
+        inside the polygon, vectorized over the points.
+        """
+        poly = np.asarray(polygon, dtype=float)
+        x, y = points[:, 0], points[:, 1]
+        inside = np.zeros(len(points), dtype=bool)
+        for (x0, y0), (x1, y1) in zip(poly, np.roll(poly, -1, axis=0)):
+            if y0 == y1:
+                continue
+            crosses = (y0 > y) != (y1 > y)
+            xcross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (x < xcross)
+        return inside
+
+    def positionTree(self):
+        """
+        Returns a cKDTree of the positions, cached for the current
+        positions.
+        """
+        return self._cached('positionTree', self._positionsKey(),
+                            lambda: cKDTree(self.positions), maxsize=1)
+
+    def nearestPosition(self, x, y):
+        """
+        Returns the index of the position closest to the point (x, y),
+        or an array of indices if x and y are arrays.
+        """
+        point = np.stack(np.broadcast_arrays(x, y), axis=-1)
+        return self.positionTree().query(point)[1]
+
+    def positionsInMask(self, mask, oversampling, origin='lr', method='nearest', equal=False):
+        """
+        Returns the indices of the positions selected by a boolean mask
+        drawn on a map from interpolatedMap(), called with the same
+        oversampling, origin, method and equal arguments. A position is
+        selected if it lies within one diagonal grid step of a masked
+        pixel.
+
+        Only the few pixels around each position can be that close, so
+        the grid coordinates of all positions are found at once and the
+        neighbouring pixels are looked up in the mask, one neighbour
+        offset at a time. The cost is independent of the mask size.
+        """
+        x, y = self._mapCache(oversampling, method, equal)[:2]
+        mask = self._flipOrigin(np.asarray(mask, dtype=bool), origin)
+        assert mask.shape == x.shape
+        stepx, stepy = x[0, 1] - x[0, 0], y[1, 0] - y[0, 0]
+        # the squared diagonal step, taken from the corner of the map as seen
+        xf, yf = self._flipOrigin(x, origin), self._flipOrigin(y, origin)
+        spacing2 = (xf[0, 1] - xf[0, 0])**2 + (yf[0, 0] - yf[1, 0])**2
+        xs, ys = x[0], y[:, 0]
 
-    def subset(self, posRange, closest=False):
+        # fractional pixel coordinates of the positions
+        col = (self.positions[:, 0] - x[0, 0]) / stepx
+        row = (self.positions[:, 1] - y[0, 0]) / stepy
+        col0, row0 = np.round(col).astype(int), np.round(row).astype(int)
+        rx = int(np.ceil(np.sqrt(spacing2) / abs(stepx))) + 1
+        ry = int(np.ceil(np.sqrt(spacing2) / abs(stepy))) + 1
+
+        selected = np.zeros(self.nPositions, dtype=bool)
+        for di in range(-ry, ry + 1):
+            for dj in range(-rx, rx + 1):
+                i, j = row0 + di, col0 + dj
+                near = (i >= 0) & (i < mask.shape[0]) & (j >= 0) & (j < mask.shape[1])
+                i, j = i[near], j[near]
+                near[near] = mask[i, j] & ((xs[j] - self.positions[near, 0])**2
+                                           + (ys[i] - self.positions[near, 1])**2 < spacing2)
+                selected |= near
+        return np.flatnonzero(selected)
+
+    def subset(self, posRange=None, closest=False, polygon=None, center=None, radius=None):
         """ 
         Returns a Scan instance containing only the scan positions which
         are within a specified range, array([[xmin, ymin, ...], [xmax,
-        ymax, ...]]). If the kwarg closest is True, and the specified
-        range contains no positions, then the returned instance contains
-        only the single closest position.
+        ymax, ...]]), and/or within a polygon or circle, see
+        selectPositions(). If the kwarg closest is True (or an integer
+        k), and the selection contains no positions, then the returned
+        instance contains only the closest (k) positions to the center of
+        the selection.
+
+        Contiguous selections give views of the data, others copies.
         """
         new = self.copy(data=False)
 
-        # lists of data and positions to fill in
-        new.positions = []
-        for dataset in self.data.keys():
-            new.data[dataset] = []
-
-        # go through all positions and only include the ones which are
-        # within range
-        for i in range(self.nPositions):
-            ok = True
-            for dim in range(self.nDimensions):
-                pos = self.positions[i, dim]
-                if pos < posRange[0, dim] or pos > posRange[1, dim]:
-                    ok = False
-                    break
-            if ok:
-                for dataset in self.data.keys():
-                    new.data[dataset].append(self.data[dataset][i])
-                new.positions.append(self.positions[i])
+        mask = self.selectPositions(posRange=posRange, polygon=polygon,
+                                    center=center, radius=radius)
+        indices = np.flatnonzero(mask)
 
         # get the closest positions if requested
-        if (len(new.positions) == 0) and closest:
-            rangeCenter = np.mean(posRange, axis=0)
-            # using sum instead of linalg.norm here, for old numpy at beamline:
-            index = np.argmin(
-                np.sum((self.positions - rangeCenter)**2, axis=1))
-            for dataset in self.data.keys():
-                new.data[dataset].append(self.data[dataset][index])
-            new.positions.append(self.positions[index])
+        if (len(indices) == 0) and closest:
+            k = 1 if closest is True else min(int(closest), self.nPositions)
+            if center is None:
+                center = np.mean(posRange if posRange is not None else polygon, axis=0)
+            center = np.asarray(center)
+            dist = np.sum((self.positions[:, :len(center)] - center)**2, axis=1)
+            indices = np.sort(np.argpartition(dist, k - 1)[:k])
+
+        # a contiguous run of positions can be expressed as a slice
+        if len(indices) and (indices[-1] - indices[0] == len(indices) - 1):
+            indices = slice(indices[0], indices[-1] + 1)
 
-        # convert lists to arrays
+        # pick out the data, lazy datasets stay lazy
         for dataset in self.data.keys():
-            new.data[dataset] = np.array(new.data[dataset])
-        new.positions = np.array(new.positions)
+            if isinstance(self.data[dataset], LazyArray):
+                if isinstance(indices, slice):
+                    new.data[dataset] = self.data[dataset].take(np.arange(indices.start, indices.stop))
+                else:
+                    new.data[dataset] = self.data[dataset].take(indices)
+            else:
+                new.data[dataset] = self.data[dataset][indices]
+        new.positions = self.positions[indices]
 
         return new
 
-    def interpolatedMap(self, values, oversampling, origin='lr', method='nearest', equal=False):
-        """ 
-        Provides a regular and interpolated xy map of the scan, with the
-        values provided. For example, a ROI integral can be provided which
-        results in an interpolated map of that ROI.
+    def _positionsKey(self):
+        """
+        Returns a cheap identifier of the current positions, for use as a
+        cache key.
+        """
+        return (self.positions.shape, hash(self.positions.tobytes()))
 
-        values: a length-N array, with one value per position
-        oversampling: the oversampling ratio relative to the average position spacing
-        origin: 'lr', 'll', 'ur', 'ul'
-        equal: use equal pixel sizes for x and y
+    def _cached(self, name, key, build, maxsize=8):
         """
-        assert self.nDimensions == 2
+        Returns build() from the named cache, where key should include
+        the _positionsKey() if the result depends on the positions. The
+        least recently used entries are dropped beyond maxsize.
+        """
+        cache = self._cache.setdefault(name, {})
+        if key in cache:
+            cache[key] = cache.pop(key)
+        else:
+            cache[key] = build()
+            while len(cache) > maxsize:
+                cache.pop(next(iter(cache)))
+        return cache[key]
 
+    def _mapGrid(self, oversampling, equal):
+        """
+        Returns the regular x, y grid used by interpolatedMap(), with
+        lower-right origin.
+        """
         xMin, xMax = np.min(self.positions[:,0]), np.max(self.positions[:,0])
         yMin, yMax = np.min(self.positions[:,1]), np.max(self.positions[:,1])
 
@@ -363,31 +895,214 @@ class Scan(object):
             xmargin = oversampling * xstepsize / 2
             ymargin = oversampling * ystepsize / 2
             y, x = np.mgrid[yMax+ymargin:yMin-ymargin:-ystepsize, xMax+xmargin:xMin-xmargin:-xstepsize]
-        z = griddata(self.positions, values, (x, y), method=method)
-        
+        return x, y
+
+    def detectGrid(self):
+        """
+        Returns a ScanGrid if the positions form a regular 2D grid, and
+        None otherwise. Handles snake scans, either axis being the fast
+        one, and a partial last line. The result is cached.
+        """
+        return self._cached('grid', self._positionsKey(), self._findGrid, maxsize=2)
+
+    def _findGrid(self):
+        if self.nDimensions != 2 or self.nPositions < 4:
+            return None
+        pos = self.positions
+        N = self.nPositions
+        d = np.abs(np.diff(pos, axis=0))
+        fast = int(np.median(d[:, 1]) > np.median(d[:, 0]))
+        f, s = pos[:, fast], pos[:, 1 - fast]
+        step = np.median(d[:, fast])
+        if not step > 0:
+            return None
+
+        # lines break where the slow axis moves
+        ds = d[:, 1 - fast]
+        breaks = np.flatnonzero(ds > max(ds.max() / 2, step / 10)) + 1
+        starts = np.concatenate(([0], breaks))
+        lengths = np.diff(np.concatenate((starts, [N])))
+        n = lengths[0]
+        if len(lengths) < 2 or n < 2 or np.any(lengths[:-1] != n) or lengths[-1] > n:
+            return None
+
+        # assign each position to the nearest point of the first line,
+        # which copes with snake scans and partial lines
+        points = f[:n]
+        order = np.argsort(points)
+        sortedPoints = points[order]
+        if np.any(np.diff(sortedPoints) < step / 2):
+            return None
+        mids = (sortedPoints[1:] + sortedPoints[:-1]) / 2
+        col = order[np.searchsorted(mids, f)]
+        row = np.repeat(np.arange(len(lengths)), lengths)
+        index = -np.ones((len(lengths), n), dtype=int)
+        index[row, col] = np.arange(N)
+        if np.count_nonzero(index >= 0) != N:
+            # several positions of a line fell on the same point
+            return None
+
+        # average the coordinates over the lines and points, and check
+        # that the grid is regular within a fraction of a step
+        points = np.bincount(col, weights=f, minlength=n) / np.bincount(col, minlength=n)
+        lines = np.bincount(row, weights=s) / lengths
+        pointSteps = np.abs(np.diff(points))
+        lineSteps = np.abs(np.diff(lines))
+        if (np.any(np.abs(f - points[col]) > np.median(pointSteps) / 3)
+            or np.any(np.abs(s - lines[row]) > np.median(lineSteps) / 3)
+            or np.ptp(pointSteps) > np.median(pointSteps) / 5
+            or np.ptp(lineSteps) > np.median(lineSteps) / 5):
+            return None
+
+        return ScanGrid(index, fast, points, lines)
+
+    @staticmethod
+    def _gridAxis(a, k):
+        """
+        Returns the n*k uniformly spaced coordinates which subdivide the
+        n pixels centered on the monotonic coordinates a into k each.
+        """
+        n = len(a)
+        step = (a[-1] - a[0]) / (n - 1)
+        return a[0] + step * (np.arange(n * k) - (k - 1) / 2.) / k
+
+    def _mapInterpolator(self, oversampling, method, equal):
+        """
+        Builds the output grid of interpolatedMap() together with a
+        function which maps values onto it. For 'nearest' that is an
+        index into the positions and for 'linear' a sparse matrix of
+        barycentric weights, so only the triangulation or KD-tree is
+        expensive, and it is only built once.
+        """
+        grid = None
+        if method == 'nearest' and oversampling >= 1 and oversampling == int(oversampling):
+            grid = self.detectGrid()
+        if grid is not None:
+            # regular grid, index the values directly at the native
+            # resolution (repeated for integer oversampling)
+            index, xs, ys = grid.index, grid.points, grid.lines
+            if grid.fast == 1:
+                index, xs, ys = index.T, ys, xs
+            xstep = abs(xs[-1] - xs[0]) / (len(xs) - 1)
+            ystep = abs(ys[-1] - ys[0]) / (len(ys) - 1)
+            if equal and abs(xstep - ystep) > min(xstep, ystep) / 100:
+                # unequal steps, which the native grid can't give
+                grid = None
+        if grid is not None:
+            # lower-right origin means descending axes
+            if xs[0] < xs[-1]:
+                index, xs = index[:, ::-1], xs[::-1]
+            if ys[0] < ys[-1]:
+                index, ys = index[::-1], ys[::-1]
+            k = int(oversampling)
+            index = np.repeat(np.repeat(index, k, axis=0), k, axis=1).ravel()
+            missing = (index < 0)
+            index[missing] = 0
+            y, x = np.meshgrid(self._gridAxis(ys, k), self._gridAxis(xs, k), indexing='ij')
+            def gather(values):
+                if isinstance(values, LazyArray):
+                    z = values[index]
+                else:
+                    z = np.asarray(values)[index]
+                if missing.any():
+                    z = z.astype(float)
+                    z[missing] = np.nan
+                return z
+            return x, y, gather
+
+        x, y = self._mapGrid(oversampling, equal)
+        xi = np.vstack((x.ravel(), y.ravel())).T
+
+        if method == 'nearest':
+            index = cKDTree(self.positions).query(xi)[1]
+            def gather(values):
+                if isinstance(values, LazyArray):
+                    return values[index]
+                return np.asarray(values)[index]
+
+        elif method == 'linear':
+            tri = Delaunay(self.positions)
+            simplex = tri.find_simplex(xi)
+            outside = (simplex == -1)
+            # barycentric coordinates, as in scipy's LinearNDInterpolator
+            T = tri.transform[simplex]
+            b = np.einsum('ijk,ik->ij', T[:, :2], xi - T[:, 2])
+            weights = np.hstack((b, 1 - b.sum(axis=1, keepdims=True)))
+            weights[outside] = 0
+            W = scipy.sparse.csr_matrix(
+                (weights.ravel(), tri.simplices[simplex].ravel(),
+                 np.arange(0, 3 * len(xi) + 1, 3)),
+                shape=(len(xi), self.nPositions))
+            def gather(values):
+                values = np.asarray(values)
+                z = W.dot(values.reshape((self.nPositions, -1)).astype(float))
+                z[outside] = np.nan
+                return z.reshape((len(xi),) + values.shape[1:])
+
+        else:
+            tri = Delaunay(self.positions)
+            def gather(values):
+                return CloughTocher2DInterpolator(tri, np.asarray(values))(xi)
+
+        return x, y, gather
+
+    def _mapCache(self, oversampling, method, equal):
+        """
+        Returns the cached result of _mapInterpolator() for the current
+        positions.
+        """
+        return self._cached('interpolatedMap',
+            (self._positionsKey(), oversampling, method, equal),
+            lambda: self._mapInterpolator(oversampling, method, equal))
+
+    @staticmethod
+    def _flipOrigin(a, origin):
+        """
+        Flips a map with lower-right origin to the requested origin.
+        """
+        if origin in ('ll', 'ul'):
+            a = a[:, ::-1]
+        if origin in ('ur', 'ul'):
+            a = a[::-1]
+        return a
+
+    def interpolatedMap(self, values, oversampling, origin='lr', method='nearest', equal=False):
+        """ 
+        Provides a regular and interpolated xy map of the scan, with the
+        values provided. For example, a ROI integral can be provided which
+        results in an interpolated map of that ROI.
+
+        values: a length-N array, with one value per position
+        oversampling: the oversampling ratio relative to the average position spacing
+        origin: 'lr', 'll', 'ur', 'ul'
+        equal: use equal pixel sizes for x and y
+
+        The grid and the interpolation weights are cached for the current
+        positions, so repeated calls with new values are cheap. Scans on
+        a regular grid (see detectGrid) are mapped without interpolation
+        with method='nearest', at the native resolution times the
+        oversampling, unless the oversampling is fractional or equal
+        pixel sizes are asked for with unequal x and y steps.
+        """
+        assert self.nDimensions == 2
+
+        x, y, gather = self._mapCache(oversampling, method, equal)
+        z = gather(values)
+        z = z.reshape(x.shape + z.shape[1:])
+
         # we've been assuming lower-right origin. adjust:
-        if origin == 'll':
-            x = np.fliplr(x)
-            y = np.fliplr(y)
-            z = np.fliplr(z)
-        elif origin == 'ur':
-            x = np.flipud(x)
-            y = np.flipud(y)
-            z = np.flipud(z)
-        elif origin == 'ul':
-            x = np.flipud(x)
-            y = np.flipud(y)
-            z = np.flipud(z)
-            x = np.fliplr(x)
-            y = np.fliplr(y)
-            z = np.fliplr(z)
+        x = self._flipOrigin(x, origin).copy()
+        y = self._flipOrigin(y, origin).copy()
+        z = self._flipOrigin(z, origin)
 
         return x, y, z
     
-    def export(self, filepath, method='reshape', shape=None, oversampling=1, equal=True):
+    def export(self, filepath, method='reshape', shape=None, oversampling=1, equal=True, progress=None,
+               profile='default', compression=None, level=None):
         """ 
         Dumps data into a single HDF5 file in order to allow export into other software
-        or reload later.
+        or reload later. The data is written in chunks of positions, so
+        memory use is bounded also for large and lazy datasets.
 
         filepath: full path and name of the output file
         method: "reshape"  - attempt to cast the data on a regular grid,
@@ -398,15 +1113,28 @@ class Scan(object):
         oversampling: the oversampling ratio relative to the typical step size,
                       used with "resample"
         equal:  use equal step sizes in x and y for "resample"
+        progress: optional callback, called with the fraction done
+        profile: chunking and compression profile, see EXPORT_PROFILES
+        compression, level: override the compression of the profile,
+                 where the level is only for 'gzip', 'blosc' and 'zstd'
         """
         # this only applies for 1D and 2D scans
         assert self.nDimensions in (1, 2)
 
         # check input arguments
         assert method in ('reshape', 'resample', 'none')
+        assert profile in EXPORT_PROFILES
+        opts = dict(EXPORT_PROFILES[profile])
+        if compression is not None:
+            opts['compression'], opts['level'] = compression, level
+        elif level is not None:
+            opts['level'] = level
+        filters = self._compressionArgs(opts['compression'], opts['level'])
 
         # export to hdf5 file
-        with h5py.File(filepath, 'w-', libver='earliest') as h5f:
+        # a large chunk cache, since the position chunks written do not
+        # in general line up with the chunks of the profile
+        with h5py.File(filepath, 'w-', libver='earliest', rdcc_nbytes=4*CHUNK_BYTES, rdcc_nslots=10007) as h5f:
             # create entry
             grp_path = "/entry0"
             grp = h5f.create_group(grp_path)
@@ -419,46 +1147,160 @@ class Scan(object):
             # create data group
             grp_path = "/entry0/data"
             grp = h5f.create_group(grp_path)
-            # save positions
+            # save positions, and work out which position goes where in
+            # the output (index, -1 for missing) unless it's a plain copy
+            index = None
             if method == 'reshape':
-                if shape is None:
+                grid = self.detectGrid() if shape is None else None
+                if grid is not None:
+                    shape = grid.index.shape
+                    print("Fast axis detectected to be: %s" % ('xy'[grid.fast],))
+                    if not np.array_equal(grid.index.ravel(), np.arange(self.nPositions)):
+                        # snake scan or partial last line, pick out rather than reshape
+                        index = grid.index.ravel()
+                elif shape is None:
                     shape, fast_axis_label = self._shapeFromPositions2D(self.positions[:,0],self.positions[:,1])
                     if not np.prod(shape) == self.nPositions:
                         raise Exception('Something went really wrong when trying to reshape the scan grid')
                     print("Fast axis detectected to be: %s" % (fast_axis_label,))
-                dset = h5f.create_dataset(name=grp_path+"/positions_x", data=self.positions[:,0], shape=shape, dtype=np.float, compression="lzf")
-                dset = h5f.create_dataset(name=grp_path+"/positions_y", data=self.positions[:,1], shape=shape, dtype=np.float, compression="lzf")
+                shape = tuple(shape)
+                positions = self.positions if index is None else self._gridTake(self.positions, index, fill=np.nan)
+                dset = h5f.create_dataset(name=grp_path+"/positions_x", data=positions[:,0], shape=shape, dtype=np.float, compression="lzf")
+                dset = h5f.create_dataset(name=grp_path+"/positions_y", data=positions[:,1], shape=shape, dtype=np.float, compression="lzf")
             elif method == 'resample':
-                x, y = self.interpolatedMap(np.zeros(self.nPositions), oversampling, equal=equal)[:2]
+                # the nearest position for each pixel, the same for all datasets
+                x, y, z = self.interpolatedMap(np.arange(self.nPositions), oversampling, equal=equal)
                 shape = x.shape
+                index = np.where(np.isnan(z), -1, z).astype(int).ravel()
                 dset = h5f.create_dataset(name=grp_path+"/positions_x", data=x, dtype=np.float, compression="lzf")
                 dset = h5f.create_dataset(name=grp_path+"/positions_y", data=y, dtype=np.float, compression="lzf")
             elif method == 'none':
+                shape = (self.nPositions,)
                 dset = h5f.create_dataset(name=grp_path+"/positions_x", data=self.positions[:,0], dtype=np.float, compression="lzf")
                 dset = h5f.create_dataset(name=grp_path+"/positions_y", data=self.positions[:,1], dtype=np.float, compression="lzf")
-            # create datasets
+
+            # save what is needed to read the file back as a Scan (see
+            # fromExport), in a separate group so as not to confuse other
+            # software: the original positions, which of them went into
+            # each pixel, and the metadata.
+            meta = h5f.create_group("/entry0/scan")
+            meta.attrs["method"] = method
+            meta.attrs["position_labels"] = np.array([str(l) for l in self.positionDimLabels], dtype=h5py.string_dtype())
+            meta.create_dataset("positions", data=self.positions)
+            meta.create_dataset("index", data=(np.arange(int(np.prod(shape))) if index is None else index).reshape(shape), compression="lzf")
+            for dsetname in self.data.keys():
+                axes = self.dataAxes.get(dsetname) or []
+                for i, ax in enumerate(axes):
+                    meta.create_dataset("axes/%s/%u" % (dsetname, i), data=np.asarray(ax))
+
+            # create datasets and stream the data into them, a number of
+            # output rows at a time
+            rowLength = int(np.prod(shape[1:]))
+            total = sum(int(np.prod(self.data[name].shape[1:])) for name in self.data.keys()) * int(np.prod(shape))
+            done = 0
             for dsetname in self.data.keys():
+                data = self.data[dsetname]
+                frame = data.shape[1:]
                 # total data shape
-                if method in ('reshape', 'resample'):
-                    shp = shape + self.data[dsetname].shape[1:]
-                else:
-                    shp = self.data[dsetname].shape
+                shp = shape + frame
                 # chunking
-                dt = self.data[dsetname].dtype
-                chunk = self._calcChunkSize(shp, dt.itemsize)
+                dt = data.dtype
+                if opts['chunks'] == 'default':
+                    chunk = self._calcChunkSize(shp, dt.itemsize)
+                else:
+                    chunk = self._profileChunkSize(shp, len(shape), dt.itemsize, opts['chunks'])
                 print("%s, shape: %s, chunk: %s" % (dsetname, shp, chunk,))
-                # what data to write?
-                if method in ('reshape', 'none'):
-                    data = self.data[dsetname]
-                elif method == 'resample':
-                    data = self.interpolatedMap(self.data[dsetname], oversampling, equal=equal)[-1]
-                # write it
                 if chunk not in [None,[]]:
-                    dset = h5f.create_dataset(name=grp_path+"/"+dsetname, data=data, shape=shp, chunks=chunk, dtype=dt, compression="lzf")
+                    dset = h5f.create_dataset(name=grp_path+"/"+dsetname, shape=shp, chunks=chunk, dtype=dt, **filters)
                 else:
-                    dset = h5f.create_dataset(name=grp_path+"/"+dsetname, data=data, shape=shp, dtype=dt, compression="lzf")
+                    dset = h5f.create_dataset(name=grp_path+"/"+dsetname, shape=shp, dtype=dt, **filters)
+                dset.attrs["title"] = str(self.dataTitles.get(dsetname, dsetname))
+                dset.attrs["dim_labels"] = np.array([str(l) for l in self.dataDimLabels.get(dsetname) or []], dtype=h5py.string_dtype())
+                # write it, missing positions get the scan average
+                fill = None
+                if index is not None and np.any(index < 0):
+                    fill = data.meanFrame() if isinstance(data, LazyArray) else np.mean(data, axis=0)
+                frameBytes = max(1, int(np.prod(frame)) * dt.itemsize)
+                rows = max(1, CHUNK_BYTES // (rowLength * frameBytes))
+                for sl in chunkSlices(shape[0], rows):
+                    a, b = sl.start * rowLength, sl.stop * rowLength
+                    if index is None:
+                        block = data[a:b]
+                    else:
+                        block = self._gridTake(data, index[a:b], fill=fill)
+                    dset[sl] = np.asarray(block).reshape((sl.stop - sl.start,) + shape[1:] + frame)
+                    done += (b - a) * int(np.prod(frame))
+                    if progress is not None:
+                        progress(done / float(max(total, 1)))
             print("Scan data were exported to %s:%s" % (filepath,grp_path,))
 
+    def _gridTake(self, data, index, fill=None):
+        """
+        Picks out positions of data by index, filling in the scan
+        average (or the value fill) where the index is -1.
+        """
+        missing = (index < 0)
+        out = np.array(data[np.where(missing, 0, index)])
+        if missing.any():
+            if fill is None:
+                fill = data.meanFrame() if isinstance(data, LazyArray) else np.mean(data, axis=0)
+            out[missing] = fill
+        return out
+
+    @staticmethod
+    def _compressionArgs(compression, level=None):
+        """
+        Returns the create_dataset() keyword arguments for a compression
+        named as in EXPORT_PROFILES. A level can only be given for
+        'gzip', 'blosc' and 'zstd'.
+        """
+        if level is not None and compression not in ('gzip', 'blosc', 'zstd'):
+            raise ValueError('Compression %s takes no level' % compression)
+        if compression in (None, 'none'):
+            return {}
+        if compression == 'lzf':
+            return {'compression': 'lzf'}
+        if compression == 'gzip':
+            return {'compression': 'gzip', 'compression_opts': 4 if level is None else level}
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ImportError('hdf5plugin is needed for %s compression' % compression)
+        if compression == 'bitshuffle':
+            return dict(hdf5plugin.Bitshuffle(cname='lz4'))
+        if compression == 'blosc':
+            return dict(hdf5plugin.Blosc(cname='lz4', clevel=5 if level is None else level,
+                                         shuffle=hdf5plugin.Blosc.SHUFFLE))
+        if compression == 'zstd':
+            return dict(hdf5plugin.Zstd(clevel=3 if level is None else level))
+        raise ValueError('Unknown compression %s' % compression)
+
+    @staticmethod
+    def _profileChunkSize(shape, mapDims, dsize, layout, target=1 << 20):
+        """
+        Returns chunks of about target bytes for data of the given shape,
+        where the first mapDims dimensions index positions, either for
+        frame-wise ('frame') or map-wise ('map') reading.
+        """
+        mapShape, frame = shape[:mapDims], shape[mapDims:]
+        if layout == 'frame':
+            # whole frames, several along the last map axis if they are small
+            n = max(1, target // max(1, int(np.prod(frame)) * dsize))
+            return (1,) * (mapDims - 1) + (min(n, mapShape[-1]),) + frame
+        elif layout == 'map':
+            # whole maps, split along the first axis only if huge
+            mapBytes = int(np.prod(mapShape)) * dsize
+            if not frame:
+                rows = max(1, mapShape[0] * target * 16 // mapBytes)
+                return (min(rows, mapShape[0]),) + mapShape[1:]
+            if mapBytes > 16 * target:
+                rows = max(1, mapShape[0] * 16 * target // mapBytes)
+                return (rows,) + mapShape[1:] + (1,) * len(frame)
+            # and a block of data channels
+            side = max(1, int((target // mapBytes) ** (1. / len(frame))))
+            return mapShape + tuple(min(side, n) for n in frame)
+        raise ValueError('Unknown chunk layout %s' % layout)
+
     def _calcChunkSize(self,shape,dsize):
         """ 
         Returns optimal shape of chunks for this type of data. Returns none if chunking is discouraged.
@@ -8,9 +8,14 @@ except ImportError:
     HAS_HDF5PLUGIN = False
     
 from .Scan import *
+from .MultiScan import MultiScan
+from .lazy import LazyArray, LazyDataset, LazySubset, LazyConcatenation
+from .reducers import Reducer, TotalSum, RoiSum, RoiMean, MaskedSum, MaskedMean, CenterOfMass
+from .dpc import dpcMaps
 from .dummy import *
 from .nanomax_nov2017 import flyscan_nov2017
 from .nanomax_nov2018 import *
 from .contrast_old import *
 from .contrast import contrast_scan
 from .softimax import *
+from .exported import exported_scan
@@ -0,0 +1,122 @@
+"""
+A content-addressed disk cache for processed datasets, so that loading
+the same scan with the same options again doesn't have to touch the raw
+detector files. Entries are keyed on the source files (path, mtime and
+size), the loader class and the loader options, and are evicted least
+recently used first when the cache grows beyond its size limit.
+
+The cache lives in $NMUTILS_CACHE or ~/.cache/nmutils, and its size limit
+in bytes can be set with $NMUTILS_CACHE_SIZE.
+"""
+
+import numpy as np
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+__docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
+
+DEFAULT_SIZE = 20 * 2**30 # 20 GiB
+
+
+class DataCache(object):
+    """
+    Stores arrays as .npy files, which are memory mapped when loaded, in
+    one directory per entry together with a json file of metadata.
+    """
+
+    def __init__(self, path=None, maxBytes=None):
+        self.path = path or os.environ.get('NMUTILS_CACHE') or \
+                    os.path.join(os.path.expanduser('~'), '.cache', 'nmutils')
+        self.maxBytes = int(maxBytes or os.environ.get('NMUTILS_CACHE_SIZE') or DEFAULT_SIZE)
+
+    def key(self, sources, cls, opts):
+        """
+        Returns the key for data made from the source files by the loader
+        class cls with the options opts (a json-able dict). Returns None
+        if any of the source files is missing.
+        """
+        h = hashlib.sha1()
+        for fn in sources:
+            try:
+                st = os.stat(fn)
+            except OSError:
+                return None
+            h.update(('%s %u %u\n' % (os.path.abspath(fn), st.st_mtime_ns, st.st_size)).encode())
+        h.update(('%s.%s\n' % (cls.__module__, cls.__name__)).encode())
+        h.update(json.dumps(opts, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def load(self, key):
+        """
+        Returns (arrays, meta) for the key, where arrays is a dict of
+        copy-on-write memory mapped arrays, or None if there's no entry.
+        """
+        entry = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'r') as fp:
+                meta = json.load(fp)
+            arrays = {name: np.load(os.path.join(entry, name + '.npy'), mmap_mode='c')
+                      for name in meta.pop('_arrays')}
+        except (OSError, ValueError, KeyError):
+            return None
+        # mark as recently used
+        os.utime(entry)
+        return arrays, meta
+
+    def store(self, key, arrays, meta):
+        """
+        Stores a dict of arrays and a json-able dict of metadata under
+        the key, then evicts old entries if needed.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.path, prefix='.tmp')
+        try:
+            for name, a in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), np.asarray(a))
+            meta = dict(meta, _arrays=list(arrays.keys()))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as fp:
+                json.dump(meta, fp)
+            entry = os.path.join(self.path, key)
+            if os.path.exists(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp, entry)
+        except OSError as e:
+            print('Could not write to the data cache: %s' % e)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def _entries(self):
+        """ Returns a list of (last use, size, path) for all entries. """
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, fn)) for fn in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        return entries
+
+    def size(self):
+        """ The total size of the cache in bytes. """
+        return sum(e[1] for e in self._entries())
+
+    def evict(self, maxBytes=None):
+        """
+        Removes the least recently used entries until the cache is within
+        maxBytes, by default the size limit.
+        """
+        maxBytes = self.maxBytes if maxBytes is None else maxBytes
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        while entries and total > maxBytes:
+            used, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """ Removes all entries. """
+        self.evict(0)
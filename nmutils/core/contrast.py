@@ -1,10 +1,11 @@
 from . import Scan
-from ..utils import fastBinPixels
+from .lazy import LazyDataset
 from .. import NoDataException
 import numpy as np
 import h5py
 import copy as cp
 import os.path
+import glob
 
 class contrast_scan(Scan):
     """
@@ -43,6 +44,11 @@ class contrast_scan(Scan):
             'type': list,
             'doc': 'detector area to load, [i0, i1, j0, j1]',
             },
+        'xrdBinning': {
+            'value': 1,
+            'type': int,
+            'doc': 'bin detector pixels n-by-n by summing (after cropping)',
+            },
         'I0': {
             'value': '',
             'type': str,
@@ -73,6 +79,16 @@ class contrast_scan(Scan):
             'type': bool,
             'doc': 'adds base motor values to piezo positions',
         },
+        'lazy': {
+            'value': False,
+            'type': bool,
+            'doc': 'leave 2D detector data on disk and read frames on demand',
+        },
+        'cache': {
+            'value': False,
+            'type': bool,
+            'doc': 'keep the processed data in a disk cache, see nmutils.core.cache',
+        },
     }
 
     # an optional class attribute which lets scanViewer know what
@@ -82,6 +98,9 @@ class contrast_scan(Scan):
     sourceDims.update(albaDims)
     assert sorted(sourceDims.keys()) == sorted(default_opts['dataSource']['type'])
 
+    # options which determine the positions, see Scan.addDatasets()
+    positionOpts = ('fileName', 'xMotor', 'yMotor', 'nMaxPositions', 'globalPositions')
+
     def _prepareData(self, **kwargs):
         """ 
         This method gets the kwargs passed to the addData() method, and
@@ -95,6 +114,16 @@ class contrast_scan(Scan):
             self.path = os.path.dirname(self.path)
         self.fileName = os.path.join(self.path, '%06u.h5'%self.scanNr)
 
+    def _cacheSources(self):
+        """
+        The main file and the detector files next to it. The waxs data
+        is processed elsewhere and isn't cached.
+        """
+        if self.dataSource == 'waxs':
+            return None
+        pattern = os.path.join(self.path, 'scan_%06u_*.h*5' % self.scanNr)
+        return [self.fileName] + sorted(glob.glob(pattern))
+
     def _readPositions(self):
         """ 
         Override position reading. Should return N by 2 array [x, y].
@@ -103,7 +132,7 @@ class contrast_scan(Scan):
         if not os.path.exists(self.fileName):
             print('File not found! \n    ', self.filename)
             raise NoDataException(self.fileName)
-        with h5py.File(self.fileName, 'r') as fp:
+        with self._open(self.fileName) as fp:
             # replace sx, sy, sz by buffered positions
             if 'entry/measurement/npoint_buff' in fp:
                 mapping = {'s%s'%dim: 'npoint_buff/%s'%dim for dim in 'xyz'}
@@ -156,6 +185,14 @@ class contrast_scan(Scan):
         print('loaded %u positions'%x.shape)
         return np.vstack((x, y)).T
 
+    def _readI0(self):
+        with self._open(self.fileName) as fp:
+            try:
+                return fp['entry/measurement/%s' % self.I0][:]
+            except KeyError:
+                print('I0 data %s not found'%self.I0)
+                raise NoDataException()
+
     def _readData(self, name):
         """ 
         Override data reading. In principle these are the same for
@@ -164,17 +201,12 @@ class contrast_scan(Scan):
         """
 
         if self.I0:
-            with h5py.File(self.fileName, 'r') as fp:
-                try:
-                    I0_data = fp['entry/measurement/%s' % self.I0][:]
-                except KeyError:
-                    print('I0 data %s not found'%self.I0)
-                    raise NoDataException()
+            I0_data = self._memoized(('I0', self.fileName, self.I0), self._readI0)
 
         if self.dataSource in ('merlin', 'pilatus', 'pilatus1m', 'eiger'):
             print('loading %s data...' % self.dataSource)
 
-            with h5py.File(self.fileName, 'r') as fp:
+            with self._open(self.fileName) as fp:
                 try:
                     dset = fp['entry/measurement/%s/frames' % self.dataSource]
                 except KeyError:
@@ -188,17 +220,28 @@ class contrast_scan(Scan):
                     i0, i1 = 0, dset.shape[-2]
                     j0, j1 = 0, dset.shape[-1]                    
 
-                # maybe there were detector bursts - then no need to allocate the whole thing
-                im_per_pos = None
+                # maybe there were detector bursts, which are summed
+                # from cropped hyperslabs of whole bursts
+                im_per_pos = 1
                 if dset.shape[0] > self.nAvailablePositions:
-                    nmax = self.nAvailablePositions
-                    if self.nMaxPositions:
-                        nmax = self.nMaxPositions
                     im_per_pos = dset.shape[0] // self.nAvailablePositions
                     print('more images than positions, assuming bursts of %u were made and summing these'%im_per_pos)
-                    data = np.empty(dtype=dset.dtype, shape=(nmax, *dset.shape[1:]))
-                    for i in range(nmax):
-                        data[i] = np.sum(dset[i*im_per_pos:(i+1)*im_per_pos], axis=0)
+                    nmax = min(self.nMaxPositions or self.nAvailablePositions, dset.shape[0] // im_per_pos)
+                else:
+                    nmax = min(self.nMaxPositions or dset.shape[0], dset.shape[0])
+
+                if self.lazy:
+                    norm = I0_data[:nmax] if self.I0 else None
+                    data = LazyDataset(self.fileName, dset.name, index=np.arange(nmax),
+                                       crop=(slice(i0, i1), slice(j0, j1)), norm=norm,
+                                       burst=im_per_pos, binning=self.xrdBinning)
+                    print('leaving %s data on disk, frames will be read on demand' % self.dataSource)
+                    return data
+                elif im_per_pos > 1 or self.xrdBinning > 1:
+                    # read chunk by chunk, only keeping the reduced frames
+                    data = np.asarray(LazyDataset(self.fileName, dset.name, index=np.arange(nmax),
+                                                  crop=(slice(i0, i1), slice(j0, j1)),
+                                                  burst=im_per_pos, binning=self.xrdBinning))
                 elif self.nMaxPositions:
                     data = dset[:self.nMaxPositions, i0:i1, j0:j1]
                 else:
@@ -209,7 +252,7 @@ class contrast_scan(Scan):
 
         elif self.dataSource == 'xspress3':
 
-            with h5py.File(self.fileName, 'r') as fp:
+            with self._open(self.fileName) as fp:
                 try:
                     dset = fp['entry/measurement/%s/frames' % self.dataSource]
                 except KeyError:
@@ -229,7 +272,7 @@ class contrast_scan(Scan):
             self.dataAxes[name] = [np.arange(data.shape[-1]) * .01]
 
         elif self.sourceDims[self.dataSource] == 0:
-            with h5py.File(self.fileName, 'r') as fp:
+            with self._open(self.fileName) as fp:
                 try:
                     data = fp['entry/measurement/%s' % self.dataSource][:]
                     print('couldnt find %s'%self.dataSource)
@@ -1,5 +1,6 @@
 from . import Scan
-from ..utils import fastBinPixels
+from ..utils import binArray, sumDtype
+from .parallel import readLines, lineShape
 from .. import NoDataException
 import numpy as np
 import h5py
@@ -52,7 +53,7 @@ class contrast_stepscan_old(Scan):
         'xrdBinning': {
             'value': 1,
             'type': int,
-            'doc': 'bin xrd pixels n-by-n (after cropping)',
+            'doc': 'bin xrd pixels n-by-n by summing (after cropping)',
             },
         'normalize_by_I0': {
             'value': False,
@@ -204,7 +205,7 @@ class contrast_stepscan_old(Scan):
                         else:
                             data_ = np.array(dataset[subframe])
                     if self.xrdBinning > 1:
-                        data_ = fastBinPixels(data_, self.xrdBinning)
+                        data_ = binArray(data_, self.xrdBinning)
                     data.append(data_)
 
             print("loaded %d images"%len(data))
@@ -261,7 +262,7 @@ class contrast_stepscan_old(Scan):
         return data
 
 from . import Scan
-from ..utils import fastBinPixels
+from ..utils import binArray, sumDtype
 from .. import NoDataException
 import numpy as np
 import h5py
@@ -307,6 +308,11 @@ class contrast_flyscan_old(Scan):
         'type': list,
         'doc': 'detector area to load, [i0, i1, j0, j1]',
         },
+    'xrdBinning': {
+        'value': 1,
+        'type': int,
+        'doc': 'bin xrd pixels n-by-n by summing (after cropping)',
+        },
     'nMaxLines': {
         'value': 0,
         'type': int,
@@ -327,6 +333,16 @@ class contrast_flyscan_old(Scan):
         'type': str,
         'doc': 'path to waxs data, absolute or relative to h5 folder, <sampledir> is replaced',
         },
+    'nWorkers': {
+        'value': 0,
+        'type': int,
+        'doc': 'number of parallel line readers for 2D and xspress3 data, 0 means one per CPU core',
+        },
+    'workerType': {
+        'value': 'threads',
+        'type': ['threads', 'processes'],
+        'doc': 'read lines in parallel threads or processes',
+        },
     }
 
     # an optional class attribute which lets scanViewer know what
@@ -357,10 +373,13 @@ class contrast_flyscan_old(Scan):
         self.slowMotor = opts['slowMotor']['value']
         self.xrfChannel = list(map(int, opts['xrfChannel']['value']))
         self.xrdCropping = list(map(int, opts['xrdCropping']['value']))
+        self.xrdBinning = opts['xrdBinning']['value']
         self.nMaxLines = opts['nMaxLines']['value']
         self.globalPositions = opts['globalPositions']['value']
         self.normalize_by_I0 = opts['normalize_by_I0']['value']
         self.waxsPath = opts['waxsPath']['value']
+        self.nWorkers = opts['nWorkers']['value']
+        self.workerType = opts['workerType']['value']
 
         # Sanity check
         try:
@@ -444,6 +463,7 @@ class contrast_flyscan_old(Scan):
         if self.dataSource in ('merlin', 'pilatus', 'pilatus1m', 'xspress3'):
             print("Loading %s data..." % self.dataSource)
             crop = (self.dataSource != 'xspress3') and self.xrdCropping
+            binning = 1 if self.dataSource == 'xspress3' else self.xrdBinning
 
             with h5py.File(self.fileName, 'r') as fp:
 
@@ -457,22 +477,22 @@ class contrast_flyscan_old(Scan):
                 line_length = line1.shape[0]
                 if crop:
                     i0, i1, j0, j1 = self.xrdCropping
-                    data_shape = line1[0, i0:i1, j0:j1].shape
+                    data_shape = lineShape(line1.shape, (slice(i0, i1), slice(j0, j1)), binning)
                 else:
-                    data_shape = line1.shape[1:]
-                dtype = line1.dtype
+                    data_shape = lineShape(line1.shape, None, binning)
+                dtype = sumDtype(line1.dtype, binning**2)
                 shape = (n_lines*line_length, *data_shape)
                 print('allocating a %s %s array'%(shape, dtype))
                 data = np.empty(shape, dtype=dtype)
 
-                # load
-                for i in range(n_lines):
-                    v = fp['entry/measurement/%s/%06u' % (self.dataSource, i)]
-                    if crop:
-                        data[i*line_length : (i+1)*line_length] = v[:, i0:i1, j0:j1]
-                    else:
-                        data[i*line_length : (i+1)*line_length] = v
-                    print('loaded %u/%u lines' % (i, n_lines) + '\r', end='')
+            # load
+            jobs = [{'fileName': self.fileName,
+                     'path': 'entry/measurement/%s/%06u' % (self.dataSource, i),
+                     'crop': (slice(i0, i1), slice(j0, j1)) if crop else None,
+                     'binning': binning,
+                     } for i in range(n_lines)]
+            readLines(jobs, data, np.arange(n_lines + 1) * line_length,
+                      nWorkers=self.nWorkers, mode=self.workerType)
             if self.dataSource == 'xspress3':
                 self.dataDimLabels[name] = ['Approx. energy (keV)']
                 self.dataAxes[name] = [np.arange(4096) * .01]
@@ -0,0 +1,68 @@
+"""
+Differential phase contrast (DPC) from scanning diffraction data. The
+center of mass of each frame gives the deflection of the beam at each
+position, and integrating the deflection field over the scanned map
+gives the phase shift of the sample.
+
+    scan = nmutils.core.contrast_scan()
+    scan.addData(name='2d', dataSource='merlin', ...)
+    dpc = nmutils.core.dpcMaps(scan, psize=55e-6, distance=1.5, energy=10.)
+    plt.imshow(dpc['phase'])
+"""
+
+import numpy as np
+
+from .reducers import CenterOfMass
+from ..utils.dpc_utils import comToAngles, integrateGradients
+from ..utils.propagation_utils import HC
+
+__docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
+
+
+def dpcMaps(scan, name='2d', psize=55e-6, distance=1., energy=None, mask=None,
+            com=None, reference=None, signs=(1, 1), positionUnit=1e-6,
+            oversampling=1, nWorkers=0):
+    """
+    Builds DPC maps of a 2D scan from the frames in scan.data[name].
+
+    psize: detector pixel size (m)
+    distance: sample-detector distance (m)
+    energy: photon energy (keV), needed for the phase map
+    mask: frame-shaped boolean array of pixels to exclude
+    com: the (N x 2) centers of mass, if already known, otherwise they
+         are calculated from the frames with nWorkers threads (see
+         Scan.reduce)
+    reference: the (row, column) position of the undeflected beam,
+         by default the median center of mass
+    signs: factors for the (x, y) deflections, to match the detector
+         orientation to the directions of the scan axes
+    positionUnit: the scan positions in m
+    oversampling: as for Scan.interpolatedMap, where regular grids are
+         mapped directly (see Scan.detectGrid)
+
+    The detector columns are taken along the first and the rows along
+    the second position dimension. Returns a dict of maps, with the
+    upper-left origin of Scan.interpolatedMap:
+
+    x, y: the position grids
+    com: the (N x 2) centers of mass, for reuse
+    dx, dy: the deflection angles (rad), NaN where there is no data
+    opd: the integrated deflection, which is the optical path
+         difference (m) to vacuum, so -delta * thickness for a
+         refractive index 1 - delta
+    phase: the phase shift (rad), or None without an energy
+    """
+    if com is None:
+        com = scan.reduce(name, CenterOfMass(mask=mask, name='com'), nWorkers=nWorkers)['com']
+    angles = comToAngles(com, psize, distance, reference=reference)
+    angles = angles[:, ::-1] * np.asarray(signs, dtype=float)
+
+    x, y, a = scan.interpolatedMap(angles, oversampling, origin='ul', method='nearest')
+    stepx = (x[0, 1] - x[0, 0]) * positionUnit
+    stepy = (y[1, 0] - y[0, 0]) * positionUnit
+    opd = integrateGradients(a[..., 0], a[..., 1], stepx, stepy)
+    opd[~np.isfinite(a).all(axis=-1)] = np.nan
+    phase = None if energy is None else 2 * np.pi * energy / HC * opd
+
+    return {'x': x, 'y': y, 'com': com, 'dx': a[..., 0], 'dy': a[..., 1],
+            'opd': opd, 'phase': phase}
@@ -1,5 +1,6 @@
 import numpy as np
 from .Scan import Scan
+from ..utils import binArray, fft_utils
 from scipy.misc import face
 import copy
 
@@ -40,6 +41,11 @@ class dummyScan(Scan):
             'type': bool,
             'doc': "Whether or not to Fourier transform exposure",
             },
+        'xrdBinning': {
+            'value': 1,
+            'type': int,
+            'doc': 'bin xrd pixels n-by-n by summing',
+            },
         }
 
     # an optional class attribute which lets scanViewer know what
@@ -63,6 +69,7 @@ class dummyScan(Scan):
         self.stepsize = int(opts['stepsize']['value'])
         self.framesize = int(opts['framesize']['value'])
         self.doFourier = opts['fourier']['value']
+        self.xrdBinning = int(opts['xrdBinning']['value'])
 
         self.image = face(gray=True)
 
@@ -94,15 +101,17 @@ class dummyScan(Scan):
                 dataframe = self.image[pos[1]-frame//2:pos[1]+frame//2,
                                    pos[0]-frame//2:pos[0]+frame//2,]
                 if self.doFourier:
-                    dataframe = np.abs(np.fft.fftshift(np.fft.fft2(dataframe)))**2
+                    dataframe = np.abs(np.fft.fftshift(fft_utils.fft2(dataframe)))**2
                 data.append(dataframe)
                 self.dataTitles[name] = 'Very fake XRD data'
+            if self.xrdBinning > 1:
+                data = binArray(np.array(data), self.xrdBinning)
         elif self.dataSource == 'fake-xrf':
             for pos in self.positions:
                 dataframe = self.image[pos[1]-frame//2:pos[1]+frame//2,
                                    pos[0]-frame//2:pos[0]+frame//2,]
                 if self.doFourier:
-                    dataframe = np.abs(np.fft.fftshift(np.fft.fft2(dataframe)))**2
+                    dataframe = np.abs(np.fft.fftshift(fft_utils.fft2(dataframe)))**2
                 data.append(np.mean(dataframe, axis=0))
                 self.dataTitles[name] = 'Very fake XRF data'
                 self.dataAxes[name] = [np.arange(data[-1].shape[-1]) * .01,]
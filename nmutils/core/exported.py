@@ -0,0 +1,130 @@
+from . import Scan
+from .lazy import LazyDataset
+from .. import NoDataException
+import numpy as np
+import h5py
+import os.path
+
+class exported_scan(Scan):
+    """
+    Reads files written by Scan.export() back, see also Scan.fromExport().
+    The dataSource option picks the datasets '2d', '1d' and '0d' written
+    by the scanViewer, while the dataset option can name any other.
+    """
+
+    default_opts = {
+        'fileName': {
+            'value': None,
+            'type': str,
+            'doc': "exported hdf5 file",
+            },
+        'dataSource': {
+            'value': '2d',
+            'type': ['2d', '1d', '0d'],
+            'doc': "type of data",
+            },
+        'dataset': {
+            'value': '',
+            'type': str,
+            'doc': 'name of the dataset to load, overrides dataSource',
+            },
+        'lazy': {
+            'value': True,
+            'type': bool,
+            'doc': 'leave 1D and 2D data on disk and read frames on demand',
+            },
+    }
+
+    # an optional class attribute which lets scanViewer know what
+    # dataSource options have what dimensionalities. Good for the GUI.
+    sourceDims = {'2d': 2, '1d': 1, '0d': 0}
+    assert sorted(sourceDims.keys()) == sorted(default_opts['dataSource']['type'])
+
+    # the positions only depend on the file, see Scan.addDatasets()
+    positionOpts = ('fileName',)
+
+    # datasets in /entry0/data which are not scan data
+    reserved = ('positions_x', 'positions_y')
+
+    @classmethod
+    def datasetNames(cls, fileName):
+        """ Returns the names of the scan datasets in an exported file. """
+        names = []
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset) and name not in cls.reserved:
+                names.append(name)
+        with h5py.File(fileName, 'r') as fp:
+            fp['entry0/data'].visititems(visit)
+        return names
+
+    def _prepareData(self, **kwargs):
+        """
+        This method gets the kwargs passed to the addData() method, and
+        stores them for use during this data loading.
+        """
+        # the base class method parses everything
+        super()._prepareData(**kwargs)
+        if not self.dataset:
+            self.dataset = self.dataSource
+        if not self.fileName or not os.path.exists(self.fileName):
+            raise NoDataException('File not found: %s' % self.fileName)
+
+    def _readPositions(self):
+        """
+        Restores the positions, and works out which pixel of the exported
+        maps holds each position.
+        """
+        with self._open(self.fileName) as fp:
+            if 'entry0/scan' in fp:
+                meta = fp['entry0/scan']
+                method = meta.attrs['method']
+                index = meta['index'][()]
+                self.positionDimLabels = [str(l) for l in meta.attrs['position_labels']]
+                positions = meta['positions'][()]
+            else:
+                # older exports, take the positions of the pixels
+                method = 'resample'
+                index = None
+            x = self._safe_get_array(fp, 'entry0/data/positions_x')
+            y = self._safe_get_array(fp, 'entry0/data/positions_y')
+
+        self.mapShape = x.shape
+        if method == 'resample':
+            # the pixels become the positions, except those without data
+            positions = np.vstack((x.ravel(), y.ravel())).T
+            valid = np.isfinite(positions).all(axis=1)
+            if index is not None:
+                valid &= (index.ravel() >= 0)
+            self.pixels = np.flatnonzero(valid)
+            positions = positions[self.pixels]
+        else:
+            # the pixel holding each of the original positions
+            index = index.ravel()
+            self.pixels = np.empty(len(positions), dtype=int)
+            valid = np.flatnonzero(index >= 0)
+            self.pixels[index[valid]] = valid
+
+        print('loaded %u positions' % len(positions))
+        return positions
+
+    def _readData(self, name):
+        """
+        Reads the data, lazily if requested, for 1D and 2D data.
+        """
+        path = 'entry0/data/%s' % self.dataset
+        with self._open(self.fileName) as fp:
+            dset = self._safe_get_dataset(fp, path)
+            ndim = dset.ndim - len(self.mapShape)
+            if 'title' in dset.attrs:
+                self.dataTitles[name] = str(dset.attrs['title'])
+            if 'dim_labels' in dset.attrs and len(dset.attrs['dim_labels']) == ndim:
+                self.dataDimLabels[name] = [str(l) for l in dset.attrs['dim_labels']]
+            axes = 'entry0/scan/axes/%s' % self.dataset
+            if axes in fp and len(fp[axes]) == ndim:
+                self.dataAxes[name] = [fp[axes]['%u' % i][()] for i in range(ndim)]
+
+        data = LazyDataset(self.fileName, path, index=self.pixels,
+                           positionDims=len(self.mapShape))
+        if not (self.lazy and ndim):
+            data = np.asarray(data)
+        return data
@@ -0,0 +1,427 @@
+"""
+Lazy, array-like datasets which only read frames from disk when they are
+needed. These can be stored in Scan.data in place of numpy arrays, which
+makes it possible to browse and reduce scans which do not fit in memory.
+
+All classes here index positions along the first axis, just like the
+numpy arrays normally found in Scan.data. Indexing returns numpy arrays,
+while the take() method returns a new lazy object.
+"""
+
+import numpy as np
+import h5py
+
+from ..utils import binArray, sumDtype
+
+__docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
+
+# approximate number of bytes read from disk in one go
+CHUNK_BYTES = 1 << 26 # 64 MiB
+
+
+def chunkSlices(n, chunk):
+    """ Yields slices which together cover range(n), in steps of chunk. """
+    for i in range(0, n, chunk):
+        yield slice(i, min(i + chunk, n))
+
+
+class LazyArray(object):
+    """
+    Base class for array-like proxies over position-indexed data.
+    Subclasses only have to implement _read(), which gets a sorted array
+    of unique position indices and returns the corresponding frames as
+    a numpy array. Indexing, iteration, reductions and conversion to
+    numpy are all built on top of that, working in chunks of positions
+    so that the full dataset is never held in memory unless asked for.
+    """
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+        self._meanFrame = None
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    @property
+    def frameBytes(self):
+        return max(1, int(np.prod(self.shape[1:])) * self.dtype.itemsize)
+
+    @property
+    def chunkPositions(self):
+        """ The number of positions read in one go. """
+        return max(1, CHUNK_BYTES // self.frameBytes)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<%s shape=%s dtype=%s>' % (self.__class__.__name__, self.shape, self.dtype)
+
+    def _read(self, index):
+        """
+        Placeholder method to be subclassed. Returns an array of frames
+        for the sorted array of unique position indices index.
+        """
+        raise NotImplementedError
+
+    def read(self, index):
+        """
+        Reads the frames for an arbitrary integer array of positions,
+        which may be unsorted and contain duplicates.
+        """
+        index = np.asarray(index, dtype=int).reshape(-1)
+        index[index < 0] += self.shape[0]
+        if np.any((index < 0) | (index >= self.shape[0])):
+            raise IndexError('Position index out of range for %s' % self)
+        if index.size and np.all(np.diff(index) > 0):
+            return self._read(index)
+        unique, inverse = np.unique(index, return_inverse=True)
+        return self._read(unique)[inverse]
+
+    def _positionIndex(self, key):
+        """
+        Converts the position part of an index expression to an integer
+        array, or returns an int for scalar indexing.
+        """
+        n = self.shape[0]
+        if isinstance(key, (int, np.integer)):
+            if key < -n or key >= n:
+                raise IndexError('Index %d out of range for %s' % (key, self))
+            return int(key) % n
+        if isinstance(key, slice):
+            return np.arange(n)[key]
+        key = np.asarray(key)
+        if key.dtype == bool:
+            return np.flatnonzero(key)
+        return key.astype(int).reshape(-1)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if not key:
+            first, rest = slice(None), ()
+        elif key[0] is Ellipsis:
+            first, rest = slice(None), key
+        else:
+            first, rest = key[0], key[1:]
+        if first is None:
+            raise IndexError('Adding axes is not supported on %s' % self.__class__.__name__)
+        index = self._positionIndex(first)
+        if np.isscalar(index):
+            return self.read([index])[0][rest]
+        # read in chunks and apply the rest of the index to each
+        out = None
+        step = self.chunkPositions
+        for sl in chunkSlices(len(index), step):
+            block = self.read(index[sl])[(slice(None),) + rest]
+            if out is None:
+                out = np.empty((len(index),) + block.shape[1:], dtype=block.dtype)
+            out[sl] = block
+        if out is None:
+            out = np.empty((0,) + self.shape[1:], dtype=self.dtype)[(slice(None),) + rest]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        a = self[:]
+        return a if dtype is None else a.astype(dtype)
+
+    def __iter__(self):
+        for sl, block in self.iterChunks():
+            for frame in block:
+                yield frame
+
+    def iterChunks(self, chunk=None):
+        """
+        Yields (slice, array) pairs covering all positions, with at most
+        chunk positions in each.
+        """
+        chunk = chunk or self.chunkPositions
+        for sl in chunkSlices(self.shape[0], chunk):
+            yield sl, self._read(np.arange(sl.start, sl.stop))
+
+    def take(self, indices):
+        """
+        Returns a lazy selection of positions. Negative indices mean
+        missing positions, which are filled with the average frame.
+        """
+        return LazySubset(self, indices)
+
+    def meanFrame(self):
+        """ The average frame, computed once and then remembered. """
+        if self._meanFrame is None:
+            mean = self.mean(axis=0)
+            if self.dtype.kind in 'iu':
+                mean = np.round(mean)
+            self._meanFrame = np.asarray(mean, dtype=self.dtype)
+        return self._meanFrame
+
+    def _reduce(self, ufunc, axis, dtype, keepdims):
+        """
+        Generic chunk-wise reduction with a numpy ufunc, over any
+        combination of axes.
+        """
+        if axis is None:
+            axes = tuple(range(self.ndim))
+        else:
+            axes = np.atleast_1d(axis).tolist()
+            axes = tuple(sorted(a % self.ndim for a in axes))
+        result = None
+        if 0 in axes:
+            # accumulate over the position axis
+            for sl, block in self.iterChunks():
+                part = ufunc.reduce(block, axis=axes, dtype=dtype)
+                result = part if result is None else ufunc(result, part)
+        else:
+            # reduce each chunk separately and stack the results
+            parts = [ufunc.reduce(block, axis=axes, dtype=dtype)
+                     for sl, block in self.iterChunks()]
+            result = np.concatenate(parts, axis=0)
+        if keepdims:
+            result = np.reshape(result, [1 if i in axes else s for i, s in enumerate(self.shape)])
+        return result
+
+    @staticmethod
+    def _output(result, out):
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    def sum(self, axis=None, dtype=None, out=None, keepdims=False, **kwargs):
+        return self._output(self._reduce(np.add, axis, dtype, keepdims), out)
+
+    def max(self, axis=None, out=None, keepdims=False, **kwargs):
+        return self._output(self._reduce(np.maximum, axis, None, keepdims), out)
+
+    def min(self, axis=None, out=None, keepdims=False, **kwargs):
+        return self._output(self._reduce(np.minimum, axis, None, keepdims), out)
+
+    def mean(self, axis=None, dtype=None, out=None, keepdims=False, **kwargs):
+        total = self._reduce(np.add, axis, np.float64, keepdims)
+        if axis is None:
+            count = self.size
+        else:
+            count = np.prod([self.shape[a] for a in np.atleast_1d(axis)])
+        if dtype is None:
+            dtype = self.dtype if self.dtype.kind in 'fc' else np.float64
+        return self._output(np.asarray(total / count, dtype=dtype), out)
+
+
+class LazyDataset(LazyArray):
+    """
+    Array-like proxy over a dataset in an hdf5 file, where the first
+    index is the position. The file is only opened when frames are
+    actually read.
+
+    fileName: the hdf5 file
+    path:     path to the dataset within that file
+    index:    which frames of the dataset to use, defaults to all
+    crop:     optional tuple of slices applied to each frame
+    norm:     optional array with one value per position to divide by
+    positionDims: number of leading dimensions of the dataset which
+              index positions, like the (lines, points) of exported
+              maps. The index then refers to the flattened positions.
+    burst:    number of consecutive frames making up each position,
+              which are summed into a frame of a wide enough dtype
+    binning:  bin the (cropped) frames n-by-n by summing, see
+              nmutils.utils.binArray
+    """
+
+    def __init__(self, fileName, path, index=None, crop=None, norm=None, positionDims=1,
+                 burst=1, binning=1):
+        self.fileName = fileName
+        self.path = path
+        with h5py.File(fileName, 'r') as fp:
+            dset = fp[path]
+            sourceShape = dset.shape
+            dtype = dset.dtype
+            self.sourceChunks = dset.chunks
+        assert burst == 1 or positionDims == 1
+        self.burst = burst
+        self.binning = binning
+        if burst > 1:
+            sourceShape = (sourceShape[0] // burst,) + sourceShape[1:]
+        dtype = sumDtype(dtype, burst * binning**2)
+        self.sumDtype = dtype
+        self.positionDims = positionDims
+        # number of positions along each row, the first dimension
+        self.rowLength = int(np.prod(sourceShape[1:positionDims]))
+        if index is None:
+            index = np.arange(int(np.prod(sourceShape[:positionDims])))
+        self.index = np.asarray(index, dtype=int)
+        frameShape = sourceShape[positionDims:]
+        self.crop = tuple(slice(*sl.indices(n)) for sl, n in
+                          zip(crop or (), frameShape))
+        frameShape = tuple(len(range(sl.start, sl.stop, sl.step)) for sl in self.crop) + frameShape[len(self.crop):]
+        if binning > 1:
+            frameShape = frameShape[:-2] + tuple(n // binning for n in frameShape[-2:])
+        if norm is not None:
+            norm = np.asarray(norm)
+            assert norm.shape == self.index.shape
+            dtype = np.result_type(dtype, norm.dtype, np.float64)
+        self.norm = norm
+        super(LazyDataset, self).__init__((len(self.index),) + frameShape, dtype)
+
+    def cropped(self, box):
+        """
+        Returns a new LazyDataset which only reads the region box (a
+        tuple of unit-step slices relative to the current frames) from
+        disk.
+        """
+        newCrop, newShape = [], []
+        for i, (sl, n) in enumerate(zip(box, self.shape[1:])):
+            start = self.crop[i].start if i < len(self.crop) else 0
+            a, b, step = sl.indices(n)
+            assert step == 1 and (i >= len(self.crop) or self.crop[i].step == 1)
+            # binned pixels cover binning source pixels each
+            f = self.binning if i >= self.ndim - 3 else 1
+            newCrop.append(slice(start + a * f, start + max(a, b) * f))
+            newShape.append(max(a, b) - a)
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.crop = tuple(newCrop) + self.crop[len(newCrop):]
+        new.shape = (self.shape[0],) + tuple(newShape) + self.shape[1 + len(newCrop):]
+        new._meanFrame = None
+        return new
+
+    @property
+    def chunkPositions(self):
+        """ Respects the chunking of the underlying dataset if possible. """
+        n = max(1, super(LazyDataset, self).chunkPositions // self.burst)
+        unit = self.sourceChunks[0] * self.rowLength // self.burst if self.sourceChunks else None
+        if unit and n > unit:
+            n -= n % unit
+        return n
+
+    def _readRows(self, dset, r0, r1):
+        """
+        Reads whole rows r0:r1 of the dataset, flattened to frames, with
+        bursts read as one hyperslab and summed.
+        """
+        b = self.burst
+        key = (slice(r0 * b, r1 * b),) + (slice(None),) * (self.positionDims - 1) + self.crop
+        block = dset[key]
+        if b > 1:
+            block = block.reshape((r1 - r0, b) + block.shape[1:]).sum(axis=1, dtype=self.sumDtype)
+        if self.binning > 1:
+            block = binArray(block, self.binning, dtype=self.sumDtype)
+        return block.reshape((-1,) + self.shape[1:])
+
+    def _read(self, index):
+        src = self.index[index]
+        order = np.argsort(src, kind='stable')
+        srcSorted = src[order]
+        rows = srcSorted // self.rowLength
+        out = np.empty((len(index),) + self.shape[1:], dtype=self.dtype)
+        with h5py.File(self.fileName, 'r') as fp:
+            dset = fp[self.path]
+            uniqueRows = np.unique(rows)
+            if len(rows) and rows[-1] - rows[0] < 2 * len(uniqueRows):
+                # dense enough to read the whole span and pick frames from it
+                r0 = rows[0]
+                block = self._readRows(dset, r0, rows[-1] + 1)
+                frames = block[srcSorted - r0 * self.rowLength]
+            else:
+                # read contiguous runs of rows one by one
+                breaks = np.flatnonzero(np.diff(uniqueRows) != 1) + 1
+                frames = np.empty((len(index),) + self.shape[1:], dtype=self.sumDtype)
+                for run in np.split(uniqueRows, breaks):
+                    if not len(run):
+                        continue
+                    r0, r1 = run[0], run[-1] + 1
+                    a, b = np.searchsorted(rows, [r0, r1])
+                    block = self._readRows(dset, r0, r1)
+                    frames[a:b] = block[srcSorted[a:b] - r0 * self.rowLength]
+        out[order] = frames
+        if self.norm is not None:
+            out /= self.norm[index].reshape((-1,) + (1,) * (self.ndim - 1))
+        return out
+
+
+class LazySubset(LazyArray):
+    """
+    A selection of positions from another array-like. Negative indices
+    denote missing positions, which are filled with the average frame of
+    the parent.
+    """
+
+    def __init__(self, parent, indices):
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+        # avoid nesting subsets
+        if isinstance(parent, LazySubset):
+            valid = indices >= 0
+            indices = np.where(valid, parent.indices[np.where(valid, indices, 0)], -1)
+            parent = parent.parent
+        self.parent = parent
+        self.indices = indices
+        super(LazySubset, self).__init__((len(indices),) + parent.shape[1:], parent.dtype)
+
+    @property
+    def chunkPositions(self):
+        return self.parent.chunkPositions
+
+    def _read(self, index):
+        src = self.indices[index]
+        missing = src < 0
+        if not np.any(missing):
+            return self.parent.read(src)
+        out = np.empty((len(index),) + self.shape[1:], dtype=self.dtype)
+        if not np.all(missing):
+            out[~missing] = self.parent.read(src[~missing])
+        out[missing] = self.parent.meanFrame()
+        return out
+
+    def meanFrame(self):
+        if np.all(self.indices >= 0):
+            return super(LazySubset, self).meanFrame()
+        return self.parent.meanFrame()
+
+
+class LazyConcatenation(LazyArray):
+    """
+    Concatenation of numpy arrays and/or lazy arrays along the position
+    axis, without copying anything.
+    """
+
+    def __init__(self, parts):
+        flat = []
+        for p in parts:
+            if isinstance(p, LazyConcatenation):
+                flat += p.parts
+            else:
+                flat.append(p)
+        assert len(set(p.shape[1:] for p in flat)) == 1, 'Frame shapes differ'
+        self.parts = flat
+        self.offsets = np.cumsum([0] + [len(p) for p in flat])
+        shape = (int(self.offsets[-1]),) + flat[0].shape[1:]
+        super(LazyConcatenation, self).__init__(shape, np.result_type(*[p.dtype for p in flat]))
+
+    @property
+    def chunkPositions(self):
+        return min(p.chunkPositions if isinstance(p, LazyArray)
+                   else super(LazyConcatenation, self).chunkPositions
+                   for p in self.parts)
+
+    def _read(self, index):
+        out = np.empty((len(index),) + self.shape[1:], dtype=self.dtype)
+        bounds = np.searchsorted(index, self.offsets)
+        for i, part in enumerate(self.parts):
+            a, b = bounds[i], bounds[i + 1]
+            if a == b:
+                continue
+            local = index[a:b] - self.offsets[i]
+            if isinstance(part, LazyArray):
+                out[a:b] = part.read(local)
+            else:
+                out[a:b] = part[local]
+        return out
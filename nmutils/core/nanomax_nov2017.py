@@ -1,4 +1,5 @@
 from .nanomax_nov2018 import flyscan_nov2018
+from ..utils import binArray
 from .. import NoDataException
 import numpy as np
 import h5py
@@ -54,11 +55,7 @@ class flyscan_nov2017(flyscan_nov2018):
                     else:
                         data_ = np.array(dataset)
                     if self.xrdBinning > 1:
-                        shape = fastBinPixels(data_[0], self.xrdBinning).shape
-                        new_data_ = np.zeros((data_.shape[0],) + shape)
-                        for ii in range(data_.shape[0]):
-                            new_data_[ii] = fastBinPixels(data_[ii], self.xrdBinning)
-                        data_ = new_data_
+                        data_ = binArray(data_, self.xrdBinning)
                     if self.xrdNormalize:
                         i0, i1, j0, j1 = self.xrdNormalize
                         data_ = np.array(data_, dtype=float)
@@ -1,10 +1,12 @@
 from . import Scan
-from ..utils import fastBinPixels
+from ..utils import binArray, sumDtype
+from .parallel import readLines, lineShape
 from .. import NoDataException
 import numpy as np
 import h5py
 import copy as cp
 import os.path
+import glob
 
 class flyscan_nov2018(Scan):
     """
@@ -83,6 +85,21 @@ class flyscan_nov2018(Scan):
         'type': str,
         'doc': 'path to waxs data, absolute or relative to h5 folder, <sampledir> is replaced',
         },
+    'nWorkers': {
+        'value': 0,
+        'type': int,
+        'doc': 'number of parallel line readers for 2D data, 0 means one per CPU core',
+        },
+    'workerType': {
+        'value': 'threads',
+        'type': ['threads', 'processes'],
+        'doc': 'read lines in parallel threads or processes',
+        },
+    'cache': {
+        'value': False,
+        'type': bool,
+        'doc': 'keep the processed data in a disk cache, see nmutils.core.cache',
+        },
     }
 
     # an optional class attribute which lets scanViewer know what
@@ -90,6 +107,9 @@ class flyscan_nov2018(Scan):
     sourceDims = {'pil100k':2, 'xspress3':1, 'adlink':0, 'merlin':2, 'pil1m':2, 'counter':0, 'pil1m-waxs':1}
     assert sorted(sourceDims.keys()) == sorted(default_opts['dataSource']['type'])
 
+    # options which determine the positions, see Scan.addDatasets()
+    positionOpts = ('fileName', 'scanNr', 'xMotor', 'yMotor', 'nMaxLines', 'globalPositions')
+
     def _prepareData(self, **kwargs):
         """ 
         Parse the derived options
@@ -115,6 +135,20 @@ class flyscan_nov2018(Scan):
         self.normalize_by_I0 = opts['normalize_by_I0']['value']
         self.xrfChannel = list(map(int, opts['xrfChannel']['value']))
         self.waxsPath = opts['waxsPath']['value']
+        self.nWorkers = opts['nWorkers']['value']
+        self.workerType = opts['workerType']['value']
+        self.cache = opts['cache']['value']
+
+    def _cacheSources(self):
+        """
+        The main file and the detector files next to it. The waxs data
+        is processed elsewhere and isn't cached.
+        """
+        if self.dataSource == 'pil1m-waxs':
+            return None
+        path = os.path.split(os.path.abspath(self.fileName))[0]
+        pattern = os.path.join(path, 'scan_%04d_*.hdf5' % self.scanNr)
+        return [self.fileName] + sorted(glob.glob(pattern))
 
     def _read_buffered(self, fp, entry):
         """
@@ -258,43 +292,50 @@ class flyscan_nov2018(Scan):
                 filename_pattern = 'scan_%04d_pil1m_0000.hdf5'
                 hdfpath_pattern = 'entry_%04d/measurement/Pilatus/data'
 
-            data = []
             print("attempting to read %d lines of diffraction data (based on the positions array or max number of lines set)"%self.nlines)
                  
             fn = os.path.join(path, filename_pattern%self.scanNr)
             if not os.path.exists(fn): raise NoDataException('No hdf5 file found.')
+
+            # find the line lengths first, so that the output can be
+            # pre-allocated and the lines read in parallel
+            lengths = []
             with h5py.File(fn, 'r') as hf:
                 for line in range(self.nlines):
                     try:
-                        print('loading data: ' + filename_pattern%self.scanNr + ', line %d'%line)
                         dataset = self._safe_get_dataset(hf, hdfpath_pattern%line)
-                        if self.xrdCropping:
-                            i0, i1, j0, j1 = self.xrdCropping
-                            data_ = np.array(dataset[:, i0 : i1, j0 : j1])
-                        else:
-                            data_ = np.array(dataset)
-                        if self.xrdBinning > 1:
-                            shape = fastBinPixels(data_[0], self.xrdBinning).shape
-                            new_data_ = np.zeros((data_.shape[0],) + shape)
-                            for ii in range(data_.shape[0]):
-                                new_data_[ii] = fastBinPixels(data_[ii], self.xrdBinning)
-                            data_ = new_data_
-                        if self.dataSource == 'merlin':
-                            for i in range(data_.shape[0]):
-                                data_[i] = np.flipud(data_[i]) # Merlin images indexed from the bottom left...
-                        del dataset
-                        if self.normalize_by_I0:
-                            I0_line = I0_data[line]
-                            data_ = data_ / I0_line[:, None, None]
-                        data.append(data_)
-
+                        lengths.append(dataset.shape[0])
+                        if line == 0:
+                            raw_shape, dtype = dataset.shape, dataset.dtype
                     except IOError:
                         # fewer hdf5 files than positions -- this is ok
-                        print("couldn't find expected file %s, returning"%(filename_pattern%(self.scanNr, line)))
+                        print("couldn't find expected line %s, returning"%(hdfpath_pattern%line))
                         break
+            if not lengths:
+                raise NoDataException('No lines found in %s' % fn)
 
-            print("loaded %d lines of diffraction data"%len(data))
-            data = np.concatenate(data, axis=0)
+            if self.xrdCropping:
+                i0, i1, j0, j1 = self.xrdCropping
+                crop = (slice(i0, i1), slice(j0, j1))
+            else:
+                crop = None
+            if self.normalize_by_I0:
+                dtype = float
+            else:
+                dtype = sumDtype(dtype, self.xrdBinning**2)
+            shape = (sum(lengths),) + lineShape(raw_shape, crop, self.xrdBinning)
+            print('allocating a %s %s array'%(shape, np.dtype(dtype)))
+            data = np.empty(shape, dtype=dtype)
+            jobs = [{'fileName': fn,
+                     'path': hdfpath_pattern%line,
+                     'crop': crop,
+                     'binning': self.xrdBinning,
+                     'flip': self.dataSource == 'merlin', # Merlin images indexed from the bottom left...
+                     'norm': I0_data[line] if self.normalize_by_I0 else None,
+                     } for line in range(len(lengths))]
+            readLines(jobs, data, np.cumsum([0] + lengths),
+                      nWorkers=self.nWorkers, mode=self.workerType)
+            print("loaded %d lines of diffraction data"%len(lengths))
 
         elif self.dataSource == 'xspress3':
             print("loading fluorescence data...")
@@ -409,7 +450,7 @@ class stepscan_nov2018(Scan):
         'xrdBinning': {
             'value': 1,
             'type': int,
-            'doc': 'bin xrd pixels n-by-n (after cropping)',
+            'doc': 'bin xrd pixels n-by-n by summing (after cropping)',
             },
         'normalize_by_I0': {
             'value': False,
@@ -585,7 +626,7 @@ class stepscan_nov2018(Scan):
                             else:
                                 data_ = np.array(dataset[0])
                         if self.xrdBinning > 1:
-                            data_ = fastBinPixels(data_, self.xrdBinning)
+                            data_ = binArray(data_, self.xrdBinning)
                         if 'Merlin' in hdfpath_pattern:
                             data_ = np.flipud(data_) # Merlin images indexed from the bottom left...
                         data.append(data_)
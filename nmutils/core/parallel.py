@@ -0,0 +1,95 @@
+"""
+Helpers for reading the lines of fly scans in parallel, with a pool of
+threads or processes, into a preallocated array.
+"""
+
+import numpy as np
+import h5py
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from ..utils import binArray
+
+__docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
+
+
+def lineShape(shape, crop=None, binning=1):
+    """
+    Returns the frame shape resulting from readLine() for a dataset of
+    the given shape.
+    """
+    frame = shape[1:]
+    if crop:
+        frame = tuple(len(range(*sl.indices(n))) for sl, n in zip(crop, frame)) + frame[len(crop):]
+    if binning > 1:
+        frame = frame[:-2] + tuple(n // binning for n in frame[-2:])
+    return frame
+
+
+def readLine(fileName, path, crop=None, binning=1, flip=False, norm=None):
+    """
+    Reads one line dataset and returns it cropped, binned, flipped up-down
+    and normalized as requested. This is a module level function so that
+    process pools can use it.
+
+    crop:    tuple of slices applied to each frame
+    binning: bin the frames n-by-n by summing
+    flip:    flip each frame up-down
+    norm:    array with one value per frame to divide by
+    """
+    with h5py.File(fileName, 'r') as hf:
+        dataset = hf[path]
+        if crop:
+            data = dataset[(slice(None),) + tuple(crop)]
+        else:
+            data = dataset[()]
+    if binning > 1:
+        data = binArray(data, binning)
+    if flip:
+        data = data[:, ::-1]
+    if norm is not None:
+        data = data / np.asarray(norm).reshape((-1,) + (1,) * (data.ndim - 1))
+    return data
+
+
+def _readInto(out, sl, kwargs):
+    out[sl] = readLine(**kwargs)
+
+
+def readLines(jobs, out, offsets, nWorkers=1, mode='threads'):
+    """
+    Reads lines into the preallocated array out, where job i is a dict
+    of kwargs to readLine() and its result goes to
+    out[offsets[i]:offsets[i+1]].
+
+    nWorkers: number of parallel readers, 0 means one per CPU core and
+              1 reads serially
+    mode:     'threads' or 'processes'. Note that h5py serializes calls
+              into the hdf5 library, so threads mainly overlap the
+              cropping, binning and normalization, while processes also
+              decompress in parallel at the cost of copying data back.
+    """
+    assert mode in ('threads', 'processes')
+    nLines = len(jobs)
+    nWorkers = nWorkers or os.cpu_count() or 1
+    nWorkers = min(nWorkers, nLines)
+    slices = [slice(offsets[i], offsets[i+1]) for i in range(nLines)]
+
+    if nWorkers <= 1:
+        for i in range(nLines):
+            _readInto(out, slices[i], jobs[i])
+            print('loaded %u/%u lines' % (i + 1, nLines) + '\r', end='')
+    elif mode == 'threads':
+        with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+            futures = [pool.submit(_readInto, out, slices[i], jobs[i]) for i in range(nLines)]
+            for i, f in enumerate(futures):
+                f.result()
+                print('loaded %u/%u lines' % (i + 1, nLines) + '\r', end='')
+    else:
+        with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+            futures = [pool.submit(readLine, **jobs[i]) for i in range(nLines)]
+            for i, f in enumerate(futures):
+                out[slices[i]] = f.result()
+                print('loaded %u/%u lines' % (i + 1, nLines) + '\r', end='')
+    print('')
+    return out
@@ -0,0 +1,173 @@
+"""
+Reducers for Scan.reduce(), which turn chunks of frames into one scalar
+per position. Each reducer knows which region of the frame it needs, so
+that only the union of all regions has to be read from disk.
+"""
+
+import numpy as np
+
+__docformat__ = 'restructuredtext'  # This is what we're using! Learn about it.
+
+
+class Reducer(object):
+    """
+    Base class for reducers. The region attribute is a tuple of slices
+    bounding the pixels needed, or None for the whole frame.
+    """
+
+    region = None
+
+    # the itemsize of a working copy of each chunk, for reducers which
+    # convert the frames, so that Scan.reduce can size its chunks
+    workItemsize = None
+
+    def __init__(self, name=None):
+        self.name = name
+
+    def _local(self, box):
+        """
+        Returns the region of this reducer relative to the box (a tuple
+        of slices) actually read.
+        """
+        if self.region is None:
+            return tuple(slice(None) for b in box)
+        return tuple(slice(r.start - b.start, r.stop - b.start)
+                     for r, b in zip(self.region, box))
+
+    def reduce(self, block, box):
+        """
+        Placeholder method to be subclassed. Gets a chunk of frames,
+        cropped to box, and returns one value per position.
+        """
+        raise NotImplementedError
+
+
+class TotalSum(Reducer):
+    """ Sum (or mean, with mean=True) over all pixels of each frame. """
+
+    def __init__(self, mean=False, name=None):
+        super(TotalSum, self).__init__(name=name)
+        self.mean = mean
+
+    def reduce(self, block, box):
+        flat = block.reshape((block.shape[0], -1))
+        if self.mean:
+            return np.mean(flat, axis=1, dtype=np.float64)
+        return np.sum(flat, axis=1, dtype=np.float64)
+
+
+class RoiSum(Reducer):
+    """
+    Sum over a rectangular region of interest, given as [i0, i1] for 1D
+    data or [i0, i1, j0, j1] for 2D data, like the cropping options of
+    the loaders.
+    """
+
+    def __init__(self, roi, name=None):
+        super(RoiSum, self).__init__(name=name)
+        roi = list(map(int, roi))
+        self.region = tuple(slice(roi[i], roi[i+1]) for i in range(0, len(roi), 2))
+
+    def reduce(self, block, box):
+        roi = block[(slice(None),) + self._local(box)]
+        return np.sum(roi.reshape((roi.shape[0], -1)), axis=1, dtype=np.float64)
+
+
+class RoiMean(RoiSum):
+    """ Mean over a rectangular region of interest, see RoiSum. """
+
+    def reduce(self, block, box):
+        roi = block[(slice(None),) + self._local(box)]
+        return np.mean(roi.reshape((roi.shape[0], -1)), axis=1, dtype=np.float64)
+
+
+class MaskedSum(Reducer):
+    """
+    Sum over the pixels where a boolean mask, with the same shape as the
+    frames, is True. Only the bounding box of the mask is read. Compact
+    masks are summed as runs of pixels along the last frame dimension,
+    which are plain slices, and fragmented ones by gathering the pixels.
+    """
+
+    # the shortest average run which is summed run by run
+    minRunLength = 16
+
+    def __init__(self, mask, name=None):
+        super(MaskedSum, self).__init__(name=name)
+        mask = np.asarray(mask, dtype=bool)
+        if not mask.any():
+            raise ValueError('Empty mask')
+        nonzero = np.nonzero(mask)
+        self.region = tuple(slice(int(ind.min()), int(ind.max()) + 1) for ind in nonzero)
+        # indices of the mask pixels within its bounding box
+        local = mask[self.region]
+        self.pixels = np.nonzero(local)
+        self.count = len(self.pixels[0])
+        # runs as (leading indices, start, stop) within the bounding box
+        padded = np.pad(local, [(0, 0)] * (local.ndim - 1) + [(1, 1)])
+        edges = np.diff(padded.astype(np.int8), axis=-1)
+        starts = np.nonzero(edges == 1)
+        stops = np.nonzero(edges == -1)[-1]
+        leads = zip(*starts[:-1]) if local.ndim > 1 else [()] * len(stops)
+        self.runs = list(zip(leads, starts[-1], stops))
+
+    def reduce(self, block, box):
+        roi = block[(slice(None),) + self._local(box)]
+        if self.count < self.minRunLength * len(self.runs):
+            return np.sum(roi[(slice(None),) + self.pixels], axis=1, dtype=np.float64)
+        out = np.zeros(roi.shape[0], dtype=np.float64)
+        for lead, start, stop in self.runs:
+            run = roi[(slice(None),) + lead + (slice(start, stop),)]
+            out += np.sum(run, axis=1, dtype=np.float64)
+        return out
+
+
+class MaskedMean(MaskedSum):
+    """ Mean over the pixels of a boolean mask, see MaskedSum. """
+
+    def reduce(self, block, box):
+        return super(MaskedMean, self).reduce(block, box) / self.count
+
+
+class CenterOfMass(Reducer):
+    """
+    Center of mass of each frame, in pixels along each frame dimension,
+    so (row, column) for 2D frames, as one row of values per position.
+    Pixels where the optional boolean mask is True are excluded. The
+    moments of a whole chunk are found with one matrix product against
+    precomputed masked coordinate vectors, and frames without any
+    intensity get a center of mass of 0.
+    """
+
+    # the matrix product works on float64 copies of the frames
+    workItemsize = 8
+
+    def __init__(self, mask=None, name=None):
+        super(CenterOfMass, self).__init__(name=name)
+        self.mask = None if mask is None else np.asarray(mask, dtype=bool)
+        self._weights = None
+
+    def weights(self, shape):
+        """
+        Returns the (pixels x 1+ndim) matrix of masked weights and
+        weighted coordinates, built once per frame shape.
+        """
+        if self._weights is None or self._weights[0] != shape:
+            if self.mask is None:
+                keep = np.ones(shape)
+            else:
+                assert self.mask.shape == tuple(shape)
+                keep = (~self.mask).astype(float)
+            coords = np.indices(shape).reshape((len(shape), -1))
+            w = keep.ravel()
+            self._weights = (tuple(shape), np.vstack((w, coords * w)).T.copy())
+        return self._weights[1]
+
+    def reduce(self, block, box):
+        flat = block.reshape((block.shape[0], -1))
+        moments = flat @ self.weights(block.shape[1:])
+        total = moments[:, :1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            com = np.where(total != 0, moments[:, 1:] / total, 0.)
+        com[~np.isfinite(com)] = 0.
+        return com
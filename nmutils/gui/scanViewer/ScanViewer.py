@@ -69,6 +69,8 @@ class ScanViewer(qt.QMainWindow):
         # populate the scan class list
         self.ui.scanClassBox.addItem('select scan type')
         for subclass in nmutils.core.Scan.__subclasses__():
+            if subclass is nmutils.core.MultiScan:
+                continue
             self.ui.scanClassBox.addItem(subclass.__name__)
             for subclass_ in subclass.__subclasses__():
                 self.ui.scanClassBox.addItem(subclass_.__name__)
@@ -258,6 +260,7 @@ class ScanViewer(qt.QMainWindow):
             # clear all the widgets' references
             self.ui.xrdWidget.setScan(None)
             self.ui.comWidget.setScan(None)
+            self.ui.dpcWidget.setScan(None)
             self.ui.xrfWidget.setScan(None)
             self.ui.pymcaButton.setEnabled(False)
             self.ui.scalarWidget.setScan(None)
@@ -270,6 +273,7 @@ class ScanViewer(qt.QMainWindow):
             if '2d' in scn.data.keys():
                 self.ui.xrdWidget.setScan(scn)
                 self.ui.comWidget.setScan(scn)
+                self.ui.dpcWidget.setScan(scn)
             if '1d' in scn.data.keys():
                 self.ui.xrfWidget.setScan(scn)
                 self.ui.pymcaButton.setEnabled(True)
@@ -295,76 +299,53 @@ class ScanViewer(qt.QMainWindow):
             # get options
             opts = self.gatherOptions()
 
-            # add 2D data:
-            try:
-                source = self.ui.dataSource2dBox.currentText()
-                if not source:
-                    raise nmutils.NoDataException
-                scan_.addData(dataSource=source, name='2d', **opts)
-                dim = len(scan_.data['2d'].shape[1:])
-                if not dim == 2:
-                    scan_.removeData(name='2d')
-                    print("loaded 2D was %uD, discarding" % dim)
-                    raise nmutils.NoDataException
-                print("loaded 2D data: %d positions, %d x %d pixels"%(scan_.data['2d'].shape))
-            except MemoryError:
-                print("Out of memory! Consider cropping or binning your images")
-            except nmutils.NoDataException:
-                print("no 2D data found")
-            except KeyboardInterrupt:
-                print("cancelled")
-                self.statusOutput("")
-                return
-
-            # add 1D data:
+            # add 2D, 1D and 0D data in one pass over the files
+            datasets = {}
+            for name, box in (('2d', self.ui.dataSource2dBox),
+                              ('1d', self.ui.dataSource1dBox),
+                              ('0d', self.ui.dataSource0dBox)):
+                source = box.currentText()
+                if source:
+                    datasets[name] = {'dataSource': source}
             try:
-                source = self.ui.dataSource1dBox.currentText()
-                if not source:
-                    raise nmutils.NoDataException
-                scan_.addData(dataSource=source, name='1d', **opts)
-                dim = len(scan_.data['1d'].shape[1:])
-                if not dim == 1:
-                    scan_.removeData(name='1d')
-                    print("loaded 1D was %uD, discarding" % dim)
-                    raise nmutils.NoDataException
-                print("loaded 1D data: %d positions, %d channels"%(scan_.data['1d'].shape))
-            except nmutils.NoDataException:
-                print("no 1D data found")
+                scan_.addDatasets(datasets, skipMissing=True,
+                                  skipMemoryError=True, **opts)
             except KeyboardInterrupt:
                 print("cancelled")
                 self.statusOutput("")
                 return
 
-            # add 0D data:
-            try:
-                source = self.ui.dataSource0dBox.currentText()
-                if not source:
-                    raise nmutils.NoDataException
-                scan_.addData(dataSource=source, name='0d', **opts)
-                dim = len(scan_.data['0d'].shape[1:])
-                if not dim == 0:
-                    scan_.removeData(name='0d')
-                    print("loaded 0D was %uD, discarding" % dim)
-                    raise nmutils.NoDataException
-                print("loaded 0D data: %d positions"%(scan_.data['0d'].shape))
-            except nmutils.NoDataException:
-                print("no 0D data found")
-            except KeyboardInterrupt:
-                print("cancelled")
-                self.statusOutput("")
-                return
+            # discard data of the wrong dimensionality
+            for name, dim in (('2d', 2), ('1d', 1), ('0d', 0)):
+                if name not in scan_.data:
+                    print("no %uD data found" % dim)
+                    continue
+                shape = scan_.data[name].shape
+                if not len(shape[1:]) == dim:
+                    scan_.removeData(name=name)
+                    print("loaded %uD was %uD, discarding" % (dim, len(shape[1:])))
+                    print("no %uD data found" % dim)
+                elif dim == 2:
+                    print("loaded 2D data: %d positions, %d x %d pixels" % shape)
+                elif dim == 1:
+                    print("loaded 1D data: %d positions, %d channels" % shape)
+                else:
+                    print("loaded 0D data: %d positions" % shape)
 
             # maybe there was no data at all
             if scan_.positions is None:
                 self.statusOutput("No data found")
                 return
 
-            # append or store loaded scan as it is
+            # append or store loaded scan as it is, appended scans are
+            # kept as members of a MultiScan rather than concatenated
             if self.scan is None:
                 merged = scan_
-            else:
+            elif isinstance(self.scan, nmutils.core.MultiScan):
                 merged = self.scan
                 merged.merge(scan_)
+            else:
+                merged = nmutils.core.MultiScan([self.scan, scan_])
 
             # update the widgets
             if merged.nPositions > 1:
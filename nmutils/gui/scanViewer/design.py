@@ -132,6 +132,14 @@ class Ui_MainWindow(object):
         self.comWidget.setObjectName("comWidget")
         self.gridLayout_3.addWidget(self.comWidget, 0, 0, 1, 2)
         self.tabWidget.addTab(self.tab2dCom, "")
+        self.tab2dDpc = QtWidgets.QWidget()
+        self.tab2dDpc.setObjectName("tab2dDpc")
+        self.gridLayout_7 = QtWidgets.QGridLayout(self.tab2dDpc)
+        self.gridLayout_7.setObjectName("gridLayout_7")
+        self.dpcWidget = DpcWidget(self.tab2dDpc)
+        self.dpcWidget.setObjectName("dpcWidget")
+        self.gridLayout_7.addWidget(self.dpcWidget, 0, 0, 1, 2)
+        self.tabWidget.addTab(self.tab2dDpc, "")
         self.tab1d = QtWidgets.QWidget()
         self.tab1d.setObjectName("tab1d")
         self.gridLayout_5 = QtWidgets.QGridLayout(self.tab1d)
@@ -215,6 +223,7 @@ class Ui_MainWindow(object):
         self.label.setText(_translate("MainWindow", "data source"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab2d), _translate("MainWindow", "2D data"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab2dCom), _translate("MainWindow", "2D center of mass"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab2dDpc), _translate("MainWindow", "2D phase contrast"))
         self.label_3.setText(_translate("MainWindow", "data source"))
         self.pymcaButton.setText(_translate("MainWindow", "Export for PyMCA"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab1d), _translate("MainWindow", "1D data"))
@@ -223,6 +232,7 @@ class Ui_MainWindow(object):
 
 
 from .widgets.ComWidget import ComWidget
+from .widgets.DpcWidget import DpcWidget
 from .widgets.ScalarWidget import ScalarWidget
 from .widgets.XrdWidget import XrdWidget
 from .widgets.XrfWidget import XrfWidget
@@ -70,7 +70,7 @@ class PairedWidgetBase(qt.QWidget):
         self.selectionMode = 'roi'
 
     def selectByPosition(self, x, y):
-        idx = np.argmin(np.linalg.norm(self.scan.positions - np.array((x, y)), axis=1))
+        idx = self.scan.nearestPosition(x, y)
         self.map.indexBox.setValue(idx)
 
     def clearSelection(self):
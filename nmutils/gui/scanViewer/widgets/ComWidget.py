@@ -1,7 +1,8 @@
 from silx.gui import qt
-import scipy.ndimage.measurements
 import numpy as np
 
+import nmutils
+
 from .MapWidget import MapWidget
 from .Base import CustomPlotWindow
 
@@ -104,17 +105,11 @@ class ComWidget(qt.QWidget):
             # store the limits to maintain zoom
             xlims = self.map.getGraphXLimits()
             ylims = self.map.getGraphYLimits()
-            # calculate COM
-            com = []
+            # calculate COM, chunk by chunk in parallel threads
             mask = self.image.getMaskToolsDockWidget().widget().getSelectionMask()
             if (mask is None) or (not np.sum(mask)):
-                mask = np.zeros(self.scan.data['2d'][0].shape, dtype=int)
-            for im in self.scan.data['2d']:
-                com_ = scipy.ndimage.measurements.center_of_mass(im * (1 - mask))
-                if np.any(np.isnan(com_)):
-                    com_ = (0, 0)
-                com.append(com_)
-            com = np.array(com)
+                mask = None
+            com = self.scan.reduce('2d', nmutils.core.CenterOfMass(mask=mask, name='com'), nWorkers=0)['com']
             # choose which COM to show
             if direction == 1:
                 com = com[:, 1] - np.mean(com[:, 1])
@@ -0,0 +1,153 @@
+from silx.gui import qt
+import numpy as np
+
+import nmutils
+
+from .MapWidget import MapWidget
+from .ComWidget import ImageWidget
+
+class DpcWidget(qt.QWidget):
+    """
+    Differential phase contrast tab. The centers of mass are calculated
+    once per mask, and the deflection and phase maps are rebuilt from
+    them when the geometry changes.
+    """
+
+    def __init__(self, parent=None):
+
+        super(DpcWidget, self).__init__(parent=parent)
+        self.setLayout(qt.QVBoxLayout())
+        self.scan = None
+        self.com = None
+
+        # the geometry and display options
+        hbox = qt.QHBoxLayout()
+        self.displayCombo = qt.QComboBox()
+        self.displayCombo.insertItems(1, ['', 'phase', 'horizontal deflection',
+                                          'vertical deflection', 'optical path difference'])
+        self.displayCombo.currentIndexChanged.connect(self.updateMap)
+        hbox.addWidget(qt.QLabel('DPC map:'))
+        hbox.addWidget(self.displayCombo)
+        self.psizeBox = self._spinBox(55., 1., 1000., ' um')
+        self.distanceBox = self._spinBox(1., .01, 100., ' m')
+        self.energyBox = self._spinBox(10., 1., 100., ' keV')
+        for label, box in (('pixel size', self.psizeBox),
+                           ('distance', self.distanceBox),
+                           ('energy', self.energyBox)):
+            hbox.addWidget(qt.QLabel(label))
+            hbox.addWidget(box)
+        self.flipxBox = qt.QCheckBox('flip x')
+        self.flipyBox = qt.QCheckBox('flip y')
+        for box in (self.flipxBox, self.flipyBox):
+            box.stateChanged.connect(self.updateMap)
+            hbox.addWidget(box)
+        hbox.addStretch(1)
+        self.layout().addLayout(hbox)
+
+        # the image and map parts
+        splitter = qt.QSplitter()
+        self.map = MapWidget(self)
+        self.image = ImageWidget(self)
+        self.image.setGraphTitle('Mask excluded areas for DPC analysis')
+        splitter.addWidget(self.image)
+        splitter.addWidget(self.map)
+        self.layout().addWidget(splitter)
+
+        # gray out useless buttons
+        self.map.selectAction.setEnabled(False)
+        self.map.roiAction.setEnabled(False)
+        self.map.clearAction.setEnabled(False)
+        self.map.indexBox.setEnabled(False)
+
+        # connect the positions button
+        self.map.positionsAction.triggered.connect(self.togglePositions)
+
+        # a new mask means new centers of mass
+        self.image.getMaskToolsDockWidget().widget()._mask.sigChanged.connect(self.resetCom)
+
+    def _spinBox(self, value, vmin, vmax, suffix):
+        box = qt.QDoubleSpinBox()
+        box.setDecimals(2)
+        box.setRange(vmin, vmax)
+        box.setValue(value)
+        box.setSuffix(suffix)
+        box.setKeyboardTracking(False)
+        box.valueChanged.connect(self.updateMap)
+        return box
+
+    def setScan(self, scan):
+        self.scan = scan
+        self.com = None
+        if not scan:
+            self.map.removeImage('data')
+            self.image.removeImage('data')
+            return
+        if scan.data['2d'].shape[1:] == (1, 1):
+            return
+        # avoid old position grids:
+        if self.map.positionsAction.isChecked():
+            self.togglePositions()
+        self.resetMap()
+        self.resetImage()
+
+    def resetCom(self):
+        self.com = None
+        self.updateMap()
+
+    def resetMap(self):
+        self.updateMap()
+        self.map.resetZoom()
+
+    def resetImage(self):
+        self.image.addImage(self.scan.meanData(name='2d'), legend='data')
+        self.image.setKeepDataAspectRatio(True)
+        self.image.setYAxisInverted(True)
+        self.image.resetZoom()
+
+    def updateMap(self):
+        if self.scan is None:
+            return
+        try:
+            display = self.displayCombo.currentIndex()
+            if not display:
+                return
+            print('building DPC map')
+            self.window().statusOutput('Building DPC map...')
+            # store the limits to maintain zoom
+            xlims = self.map.getGraphXLimits()
+            ylims = self.map.getGraphYLimits()
+            mask = self.image.getMaskToolsDockWidget().widget().getSelectionMask()
+            if (mask is None) or (not np.sum(mask)):
+                mask = None
+            signs = (-1 if self.flipxBox.isChecked() else 1,
+                     -1 if self.flipyBox.isChecked() else 1)
+            dpc = nmutils.core.dpcMaps(self.scan, name='2d', mask=mask, com=self.com,
+                                       psize=self.psizeBox.value() * 1e-6,
+                                       distance=self.distanceBox.value(),
+                                       energy=self.energyBox.value(),
+                                       signs=signs, oversampling=self.map.interpolBox.value())
+            self.com = dpc['com']
+            z = dpc[{1: 'phase', 2: 'dx', 3: 'dy', 4: 'opd'}[display]]
+            x, y = dpc['x'], dpc['y']
+            self.map.addImage(z, legend='data',
+                scale=[abs(x[0,0]-x[0,1]), abs(y[0,0]-y[1,0])],
+                origin=[x.min(), y.min()])
+            self.map.setGraphXLimits(*xlims)
+            self.map.setGraphYLimits(*ylims)
+            self.map.setGraphXLabel(self.scan.positionDimLabels[0])
+            self.map.setGraphYLabel(self.scan.positionDimLabels[1])
+            self.window().statusOutput('')
+        except:
+            self.window().statusOutput('Failed to build DPC map. See terminal output.')
+            raise
+
+    def togglePositions(self):
+        xlims = self.map.getGraphXLimits()
+        ylims = self.map.getGraphYLimits()
+        if self.map.positionsAction.isChecked():
+            self.map.addCurve(self.scan.positions[:,0], self.scan.positions[:,1],
+                legend='scan positions', symbol='+', color='red', linestyle=' ')
+        else:
+            self.map.addCurve([], [], legend='scan positions')
+        self.map.setGraphXLimits(*xlims)
+        self.map.setGraphYLimits(*ylims)
@@ -100,19 +100,8 @@ class ScalarWidget(PairedWidgetBase):
                     print('calculating scalar from all positions')
                     data = np.mean(self.scan.data['0d'], axis=0)
                 else:
-                    # recreate the interpolated grid from above, to find masked
-                    # positions on the oversampled grid
-                    dummy = np.zeros(self.scan.nPositions)
-                    x, y, z = self.scan.interpolatedMap(dummy, self.map.interpolBox.value(), origin='ul')
-                    maskedPoints = np.vstack((x[np.where(mask)], y[np.where(mask)])).T
-                    pointSpacing2 = (x[0,1] - x[0,0])**2 + (y[0,0] - y[1,0])**2
-                    # go through actual positions and find the masked ones
-                    maskedPositions = []
-                    for i in range(self.scan.nPositions):
-                        # the minimum distance of the current position to a selected grid point:
-                        dist2 = np.sum((maskedPoints - self.scan.positions[i])**2, axis=1).min()
-                        if dist2 < pointSpacing2:
-                            maskedPositions.append(i)
+                    # find the positions under the mask on the oversampled grid
+                    maskedPositions = self.scan.positionsInMask(mask, self.map.interpolBox.value(), origin='ul')
                     # get the average and replace the image with legend 'data'
                     print('calculating average scalar from %d positions'%len(maskedPositions))
                     data = np.mean(self.scan.data['0d'][maskedPositions], axis=0)
@@ -103,9 +103,9 @@ class XrdWidget(PairedWidgetBase):
                 print('building 2D data map by averaging all pixels')
                 average = np.mean(self.scan.data['2d'], axis=(1,2))
             else:
-                ii, jj = np.where(mask)
-                print('building 2D data map by averaging %d pixels'%len(ii))
-                average = np.mean(self.scan.data['2d'][:, ii, jj], axis=1)
+                # cached per mask, so only changed pixels are read again
+                print('building 2D data map by averaging %d pixels'%np.count_nonzero(mask))
+                average = self.scan.maskSums(mask, name='2d', mean=True)
             sampling = self.map.interpolBox.value()
             x, y, z = self.scan.interpolatedMap(average, sampling, origin='ul', method='nearest')
             self.map.addImage(z, legend='data', 
@@ -147,19 +147,8 @@ class XrdWidget(PairedWidgetBase):
                     print('building 2D image from all positions')
                     data = np.mean(self.scan.data['2d'], axis=0)
                 else:
-                    # recreate the interpolated grid from above, to find masked
-                    # positions on the oversampled grid
-                    dummy = np.zeros(self.scan.nPositions)
-                    x, y, z = self.scan.interpolatedMap(dummy, self.map.interpolBox.value(), origin='ul')
-                    maskedPoints = np.vstack((x[np.where(mask)], y[np.where(mask)])).T
-                    pointSpacing2 = (x[0,1] - x[0,0])**2 + (y[0,0] - y[1,0])**2
-                    # go through actual positions and find the masked ones
-                    maskedPositions = []
-                    for i in range(self.scan.nPositions):
-                        # the minimum distance of the current position to a selected grid point:
-                        dist2 = np.sum((maskedPoints - self.scan.positions[i])**2, axis=1).min()
-                        if dist2 < pointSpacing2:
-                            maskedPositions.append(i)
+                    # find the positions under the mask on the oversampled grid
+                    maskedPositions = self.scan.positionsInMask(mask, self.map.interpolBox.value(), origin='ul')
                     print('building 2D image from %d positions'%len(maskedPositions))
                     # get the average and replace the image with legend 'data'
                     data = np.mean(self.scan.data['2d'][maskedPositions], axis=0)
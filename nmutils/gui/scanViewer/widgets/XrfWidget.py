@@ -94,11 +94,12 @@ class XrfWidget(PairedWidgetBase):
             # store the limits to maintain zoom
             xlims = self.map.getGraphXLimits()
             ylims = self.map.getGraphYLimits()
-            # get ROI information
+            # get ROI information, the window averages come from the
+            # scan's prefix-sum index, which is built on first use
             roi = self.spectrum.getCurvesRoiWidget().currentRoi
             if roi is None:
                 print("building 1D data map from the whole spectrum")
-                average = np.mean(self.scan.data['1d'], axis=1)
+                average = self.scan.windowSums((0, self.scan.data['1d'].shape[1]), name='1d', mean=True)
             else:
                 lowerval = roi.getFrom()
                 upperval = roi.getTo()
@@ -106,7 +107,7 @@ class XrfWidget(PairedWidgetBase):
                 upper = (np.abs(xvector - upperval)).argmin()
                 lower = (np.abs(xvector - lowerval)).argmin()
                 print("building 1D data map from channels %d to %d"%(lower, upper))
-                average = np.mean(self.scan.data['1d'][:, lower:upper], axis=1)
+                average = self.scan.windowSums((lower, upper), name='1d', mean=True)
 
             # interpolate and plot map
             sampling = self.map.interpolBox.value()
@@ -140,19 +141,8 @@ class XrfWidget(PairedWidgetBase):
                     print('building 1D curve from all positions')
                     data = np.mean(self.scan.data['1d'], axis=0)
                 else:
-                    # recreate the interpolated grid from above, to find masked
-                    # positions on the oversampled grid
-                    dummy = np.zeros(self.scan.nPositions)
-                    x, y, z = self.scan.interpolatedMap(dummy, self.map.interpolBox.value(), origin='ul')
-                    maskedPoints = np.vstack((x[np.where(mask)], y[np.where(mask)])).T
-                    pointSpacing2 = (x[0,1] - x[0,0])**2 + (y[0,0] - y[1,0])**2
-                    # go through actual positions and find the masked ones
-                    maskedPositions = []
-                    for i in range(self.scan.nPositions):
-                        # the minimum distance of the current position to a selected grid point:
-                        dist2 = np.sum((maskedPoints - self.scan.positions[i])**2, axis=1).min()
-                        if dist2 < pointSpacing2:
-                            maskedPositions.append(i)
+                    # find the positions under the mask on the oversampled grid
+                    maskedPositions = self.scan.positionsInMask(mask, self.map.interpolBox.value(), origin='ul')
                     print('building 1D curve from %d positions'%len(maskedPositions))
                     # get the average and replace the image with legend 'data'
                     data = np.mean(self.scan.data['1d'][maskedPositions], axis=0)
@@ -187,9 +177,12 @@ class XrfWidget(PairedWidgetBase):
         if os.path.exists(filename):
             print('Overwriting %s'%filename)
             os.remove(filename)
+        def progress(fraction):
+            self.window().statusOutput("Exporting data for PyMCA... %u%%" % (100 * fraction))
+            qt.QApplication.processEvents()
         try:
             self.scan.export(filename, method=method, shape=shape,
-                oversampling=oversampling, equal=equal)
+                oversampling=oversampling, equal=equal, progress=progress)
         except Exception as e:
             print(e)
             self.window().statusOutput("Failed to export data, see terminal for info.")
@@ -2,6 +2,8 @@ from .array_utils import *
 from .image_utils import *
 from .plot_utils import *
 from .propagation_utils import *
+from .dpc_utils import *
 from . import bodies
+from . import fft_utils
 from .ion_chamber import Ionchamber
 from .patterns import siemens_star
@@ -0,0 +1,57 @@
+""" Helper functions for differential phase contrast (DPC) imaging. """
+
+import numpy as np
+from . import fft_utils
+
+def comToAngles(com, psize, distance, reference=None):
+    """
+    Converts center of mass positions on the detector, in pixels, to
+    deflection angles in radians. com is an (N x 2) array of (row,
+    column) positions as given by the CenterOfMass reducer, psize the
+    detector pixel size and distance the sample-detector distance, in
+    the same unit. The reference position of the undeflected beam
+    defaults to the median over all positions.
+
+    Returns an (N x 2) array of (vertical, horizontal) angles.
+    """
+    com = np.asarray(com, dtype=float)
+    if reference is None:
+        reference = np.median(com, axis=0)
+    shifts = (com - np.asarray(reference, dtype=float)) * psize
+    return np.arctan2(shifts, distance)
+
+def integrateGradients(gx, gy, dx=1., dy=1., mirror=True):
+    """
+    Integrates a gradient field with the Fourier method of Frankot and
+    Chellappa, giving the function f with the least squares error in
+    df/dx = gx and df/dy = gy, where x runs along the last axis and y
+    along the second to last. Leading axes are treated as a batch, and
+    all frames are integrated in one pass. dx and dy are the pixel
+    sizes, and non-finite gradients are taken as zero.
+
+    With mirror=True, the gradients are extended antisymmetrically to
+    twice the size before integrating, which makes them periodic and
+    avoids the artefacts of opposite edges wrapping around.
+
+    Returns f with zero mean over each frame.
+    """
+    g = np.stack(np.broadcast_arrays(np.asarray(gx, dtype=float),
+                                     np.asarray(gy, dtype=float)))
+    g[~np.isfinite(g)] = 0.
+    ny, nx = g.shape[-2:]
+    if mirror:
+        # gx is odd in x and even in y, and the other way around for gy
+        sx = np.array([-1., 1.]).reshape((2,) + (1,) * (g.ndim - 1))
+        sy = sx[::-1]
+        g = np.concatenate((g, sx * g[..., ::-1]), axis=-1)
+        g = np.concatenate((g, sy * g[..., ::-1, :]), axis=-2)
+
+    G = fft_utils.fft2(g)
+    kx = 2 * np.pi * np.fft.fftfreq(g.shape[-1], dx)
+    ky = 2 * np.pi * np.fft.fftfreq(g.shape[-2], dy)[:, None]
+    k2 = kx**2 + ky**2
+    k2[0, 0] = 1.
+    F = (-1j * kx * G[0] - 1j * ky * G[1]) / k2
+    F[..., 0, 0] = 0.
+    f = fft_utils.ifft2(F).real[..., :ny, :nx]
+    return f - f.mean(axis=(-2, -1), keepdims=True)
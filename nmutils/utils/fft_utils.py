@@ -0,0 +1,174 @@
+"""
+FFT backend layer, used for all FFTs in nmutils. Transforms go to
+pyFFTW (with plans cached per shape and dtype, and FFTW wisdom saved
+between sessions), scipy.fft or numpy.fft, whichever is available
+first, unless another backend is chosen with setBackend().
+
+    from nmutils.utils import fft_utils
+    fft_utils.setBackend('scipy', threads=4)
+    F = fft_utils.fft2(frames)
+"""
+
+import numpy as np
+import os
+import pickle
+import atexit
+import threading
+from collections import OrderedDict
+
+try:
+    import pyfftw
+    import pyfftw.builders
+    HAS_PYFFTW = True
+except ImportError:
+    HAS_PYFFTW = False
+
+try:
+    import scipy.fft
+    HAS_SCIPY_FFT = True
+except ImportError:
+    HAS_SCIPY_FFT = False
+
+BACKENDS = ('pyfftw', 'scipy', 'numpy')
+
+# pyFFTW wisdom is kept next to the nmutils data cache
+WISDOM_FILE = os.path.join(os.environ.get('NMUTILS_CACHE') or
+                           os.path.join(os.path.expanduser('~'), '.cache', 'nmutils'),
+                           'fftw_wisdom.pickle')
+
+# effort is the FFTW planner effort, used for buffers up to measureBytes
+# with larger ones planned with FFTW_ESTIMATE, and the cached plans keep
+# at most maxPlans plans and cacheBytes of buffers, see setPlanner().
+_config = {'backend': None, 'threads': os.cpu_count() or 1,
+           'effort': 'FFTW_MEASURE', 'measureBytes': 1 << 24, 'cacheBytes': 1 << 28}
+_plans = OrderedDict()
+_plansLock = threading.Lock()
+_maxPlans = 32
+_wisdomLoaded = False
+
+def available():
+    """ Returns the names of the backends which can be used. """
+    return [name for name, ok in zip(BACKENDS, (HAS_PYFFTW, HAS_SCIPY_FFT, True)) if ok]
+
+def setBackend(backend=None, threads=None):
+    """
+    Chooses the FFT backend, 'pyfftw', 'scipy' or 'numpy', where None
+    means the first available one. threads is the number of threads or
+    workers used for each transform, where 0 means one per CPU core.
+    """
+    if backend is not None and backend not in available():
+        raise ValueError("FFT backend '%s' is not available, choose from %s" % (backend, available()))
+    _config['backend'] = backend
+    if threads is not None:
+        _config['threads'] = threads or os.cpu_count() or 1
+        _plans.clear()
+
+def setPlanner(effort=None, measureBytes=None, cacheBytes=None):
+    """
+    Configures the pyFFTW plans. effort is the FFTW planner effort
+    ('FFTW_ESTIMATE', 'FFTW_MEASURE', 'FFTW_PATIENT' or
+    'FFTW_EXHAUSTIVE') for transforms with buffers of up to
+    measureBytes, while larger ones are planned with FFTW_ESTIMATE.
+    cacheBytes bounds the buffers held by cached plans, and plans
+    bigger than that aren't cached at all.
+    """
+    for key, value in (('effort', effort), ('measureBytes', measureBytes),
+                       ('cacheBytes', cacheBytes)):
+        if value is not None:
+            _config[key] = value
+    _plans.clear()
+
+def getBackend():
+    """ Returns the name of the backend in use. """
+    return _config['backend'] or available()[0]
+
+def loadWisdom():
+    """ Imports saved FFTW wisdom, so that plans are quicker to make. """
+    global _wisdomLoaded
+    _wisdomLoaded = True
+    try:
+        with open(WISDOM_FILE, 'rb') as fp:
+            pyfftw.import_wisdom(pickle.load(fp))
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        pass
+
+def saveWisdom():
+    """ Saves the FFTW wisdom gathered so far, called at exit. """
+    if not (HAS_PYFFTW and _wisdomLoaded):
+        return
+    try:
+        os.makedirs(os.path.dirname(WISDOM_FILE), exist_ok=True)
+        with open(WISDOM_FILE, 'wb') as fp:
+            pickle.dump(pyfftw.export_wisdom(), fp)
+    except OSError:
+        pass
+
+atexit.register(saveWisdom)
+
+def _planBytes(entry):
+    plan = entry[0]
+    return plan.input_array.nbytes + plan.output_array.nbytes
+
+def _plan(a, axes, inverse):
+    """
+    Returns (plan, lock), where plan is a pyfftw.FFTW object for arrays
+    of this shape and dtype, which transforms between its own aligned
+    buffers, and lock has to be held while the buffers are in use since
+    the plan is shared between threads. Plans are cached, least
+    recently used first out, within the limits of setPlanner().
+    """
+    key = (a.shape, a.dtype.str, axes, inverse, _config['threads'])
+    with _plansLock:
+        if key in _plans:
+            _plans.move_to_end(key)
+            return _plans[key]
+        if not _wisdomLoaded:
+            loadWisdom()
+        buf = pyfftw.empty_aligned(a.shape, dtype=np.result_type(a.dtype, np.complex64))
+        effort = _config['effort'] if 2 * buf.nbytes <= _config['measureBytes'] else 'FFTW_ESTIMATE'
+        build = pyfftw.builders.ifftn if inverse else pyfftw.builders.fftn
+        entry = (build(buf, axes=axes, threads=_config['threads'],
+                       planner_effort=effort, avoid_copy=False),
+                 threading.Lock())
+        size = _planBytes(entry)
+        if size <= _config['cacheBytes']:
+            total = sum(_planBytes(e) for e in _plans.values()) + size
+            while _plans and (total > _config['cacheBytes'] or len(_plans) >= _maxPlans):
+                total -= _planBytes(_plans.popitem(last=False)[1])
+            _plans[key] = entry
+        return entry
+
+def _transform(a, axes, inverse):
+    a = np.asarray(a)
+    if axes is None:
+        axes = tuple(range(a.ndim))
+    axes = tuple(ax % a.ndim for ax in axes)
+    backend = getBackend()
+    if backend == 'pyfftw':
+        plan, lock = _plan(a, axes, inverse)
+        with lock:
+            plan.input_array[...] = a
+            # the output buffer is reused by the next call
+            return plan().copy()
+    elif backend == 'scipy':
+        func = scipy.fft.ifftn if inverse else scipy.fft.fftn
+        return func(a, axes=axes, workers=_config['threads'])
+    else:
+        func = np.fft.ifftn if inverse else np.fft.fftn
+        return func(a, axes=axes)
+
+def fftn(a, axes=None):
+    """ N-dimensional FFT over the given axes, by default all. """
+    return _transform(a, axes, False)
+
+def ifftn(a, axes=None):
+    """ N-dimensional inverse FFT over the given axes, by default all. """
+    return _transform(a, axes, True)
+
+def fft2(a, axes=(-2, -1)):
+    """ 2D FFT over the last two axes, so of each frame in a stack. """
+    return _transform(a, axes, False)
+
+def ifft2(a, axes=(-2, -1)):
+    """ 2D inverse FFT over the last two axes, so of each frame in a stack. """
+    return _transform(a, axes, True)
@@ -4,28 +4,48 @@ import numpy as np
 from numpy.lib.stride_tricks import as_strided
 import scipy.signal
 import scipy.ndimage
-import math
+import scipy.special
+import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 def poisson(mean, k):
-    """ Returns the normalized Poisson probability for observing k counts in a distribution described by the mean. """
-    if type(k) in [list, tuple, np.ndarray]:
-        result = []
-        for k_ in k:
-            result.append(mean**k_ * np.exp(-mean) / math.factorial(k_))
-        return np.array(result)
-    else:
-        return mean**k * np.exp(-mean) / math.factorial(k)
+    """ Returns the normalized Poisson probability for observing k counts in a distribution described by the mean. Both can be arrays, which are broadcast against each other. """
+    k = np.asarray(k)
+    result = np.exp(scipy.special.xlogy(k, mean) - mean - scipy.special.gammaln(k + 1))
+    return result if result.ndim else result[()]
     
-def smoothImage(image, sigma):
-    """ Returns a smoothened copy of the input image, which is convolved by a gaussian of standard deviation sigma. """
-    size = max(3, 3 * int(round(sigma)))
-    gaussian = gaussian2D(size, sigma)
-    # fftconvolve() is faster than convolve2d (tested)
-    # a copy of the image is created (also tested)
-    smoothImage = scipy.signal.fftconvolve(image, gaussian, mode='same')
-    return smoothImage
+def smoothImage(image, sigma, axes=None, out=None, mode='constant'):
+    """
+    Returns a smoothened copy of the input image, which is convolved by a normalized gaussian of standard deviation sigma, as separable 1D convolutions.
+
+    sigma: standard deviation in pixels, or one per axis
+    axes:  the axes to smooth, by default the last two, so that a stack of frames (N, M, K) is smoothed frame by frame. For a stack of maps, give the map axes.
+    out:   optional float array for the result, which can be the image itself to smooth in place
+    mode:  how the edges are extended, as for scipy.ndimage, where 'constant' pads with zeros
+    """
+    image = np.asarray(image)
+    if axes is None:
+        axes = tuple(range(max(0, image.ndim - 2), image.ndim))
+    axes = [ax % image.ndim for ax in np.atleast_1d(axes)]
+    sigmas = np.broadcast_to(sigma, (len(axes),))
+    if out is None:
+        # float32 stays float32, while integers give float64 as before
+        if image.dtype.kind in 'fc':
+            dtype = np.result_type(image.dtype, np.float32)
+        else:
+            dtype = np.float64
+        out = np.empty(image.shape, dtype=dtype)
+    if not len(axes):
+        out[...] = image
+    src = image
+    for ax, sig in zip(axes, sigmas):
+        scipy.ndimage.gaussian_filter1d(src, sig, axis=ax, output=out, mode=mode)
+        src = out
+    return out
     
-def noisyImage(image, photonsPerPixel=None, photonsAtMax=None, photonsTotal=None, dtype=None):
+def noisyImage(image, photonsPerPixel=None, photonsAtMax=None, photonsTotal=None, dtype=None,
+               batch=False, rng=None, nThreads=1):
     """ 
     Returns a noisy copy of the input image, with simulated 
     photon-counting noise (Poisson noise) corresponding to:
@@ -35,59 +55,122 @@ def noisyImage(image, photonsPerPixel=None, photonsAtMax=None, photonsTotal=None
     
     You can specify the dtype of the output, by default it is the same 
     as the input image.
+
+    With batch=True, the first axis indexes a stack of images which
+    get the specified number of photons each. The random numbers come
+    from rng, a numpy.random.Generator or a seed, and can be drawn in
+    nThreads parallel threads (0 means one per CPU core) for large
+    arrays. Without rng, they come from the global numpy.random state.
     """
 
+    image = np.asarray(image)
     if not dtype:
         dtype = image.dtype
+    axes = tuple(range(1, image.ndim)) if batch else None
+    shape = image.shape[1:] if batch else image.shape
 
     if photonsPerPixel and not photonsAtMax and not photonsTotal:
-        photonsTotal = np.prod(image.shape) * photonsPerPixel
+        photonsTotal = np.prod(shape) * photonsPerPixel
     elif photonsAtMax and not photonsPerPixel and not photonsTotal:
-        photonsTotal = np.sum(image) / np.max(image) * photonsAtMax
+        photonsTotal = np.sum(image, axis=axes, keepdims=True) / np.max(image, axis=axes, keepdims=True) * photonsAtMax
     elif photonsTotal and not photonsAtMax and not photonsPerPixel:
         pass
     else:
         raise ValueError('Confusing input to noisyImage')
 
-    result = np.zeros(image.shape, dtype=dtype)
-    totalSum = image.sum()
-    if len(image.shape) == 2:
-        for i in range(result.shape[0]):
-            for j in range(result.shape[1]):
-                expected = image[i, j] / totalSum * photonsTotal
-                result[i, j] = np.random.poisson(expected)
-    if len(image.shape) == 3:
-        for i in range(result.shape[0]):
-            for j in range(result.shape[1]):
-                for k in range(result.shape[2]):
-                    expected = image[i, j, k] / totalSum * photonsTotal
-                    result[i, j, k] = np.random.poisson(expected)
-    return result
-
-def biggestBlob(image):
-    """ Takes an image and returns a version with only the biggest continuous blob of non-zero elements left. """
-    labeledImage, N = scipy.ndimage.label(image)
-    # first, work out which is the biggest blob (except the background)
-    areas = []
-    for i in range(1, N + 1): # N doesn't include the background
-        areas.append(sum(sum(labeledImage == i)))
-    biggest = np.where(areas == max(areas))[0] + 1
-    return (labeledImage == biggest)
-
-def binPixels(image, n=2):
-    """ Explicitly downsamples an image by an integer amount, by binning adjacent pixels n-by-n. Odd pixels on the bottom and right are discarded. """
-    size = np.array(image.shape)
-    size[0] = size[0] // n
-    size[1] = size[1] // n
-    new = np.zeros(size, dtype=image.dtype)
-    for i in range(size[0]):
-        for j in range(size[1]):
-            tmp = np.mean(image[i * n : (i + 1) * n, j * n : (j + 1) * n], axis=(0, 1))
-            if issubclass(image.dtype.type, np.integer):
-                new[i, j] = np.round(tmp)
-            else:
-                new[i, j] = tmp
-    return new
+    expected = image / np.sum(image, axis=axes, keepdims=True) * photonsTotal
+    return poissonNoise(expected, rng=rng, nThreads=nThreads).astype(dtype)
+
+def poissonNoise(expected, rng=None, nThreads=1):
+    """
+    Draws Poisson distributed counts for an array of expected values,
+    from rng (a numpy.random.Generator or a seed). With nThreads other
+    than 1 (0 means one per CPU core), large arrays are split between
+    threads with independent generators seeded from rng. Without rng,
+    the global numpy.random state is used in a single thread, so that
+    np.random.seed() gives reproducible noise.
+    """
+    expected = np.asarray(expected)
+    if rng is None:
+        return np.random.poisson(expected)
+    rng = np.random.default_rng(rng)
+    nThreads = nThreads or os.cpu_count() or 1
+    if nThreads == 1 or expected.size < (1 << 20):
+        return rng.poisson(expected)
+    flat = expected.reshape(-1)
+    out = np.empty(flat.shape, dtype=np.int64)
+    seeds = rng.integers(2**63, size=nThreads)
+    bounds = np.linspace(0, flat.size, nThreads + 1).astype(int)
+    def draw(i):
+        a, b = bounds[i], bounds[i + 1]
+        out[a:b] = np.random.default_rng(seeds[i]).poisson(flat[a:b])
+    with ThreadPoolExecutor(max_workers=nThreads) as pool:
+        list(pool.map(draw, range(nThreads)))
+    return out.reshape(expected.shape)
+
+def _labelBlobs(image, batch=False):
+    """ Labels connected non-zero regions, separately in each frame for batch=True. """
+    image = np.asarray(image)
+    structure = scipy.ndimage.generate_binary_structure(image.ndim, 1)
+    if batch:
+        # no connections along the stack axis
+        structure[0] = False
+        structure[-1] = False
+    return scipy.ndimage.label(image, structure=structure)
+
+def blobStatistics(image, batch=False):
+    """
+    Finds the continuous blobs of non-zero elements in a 2D or 3D array,
+    and returns a dict with
+    - 'labels':    array of blob labels, 0 for the background
+    - 'areas':     number of elements in each blob
+    - 'centroids': (Nblobs x ndim) array of blob centers
+    - 'starts', 'stops': (Nblobs x ndim) arrays with the bounding box
+                   of each blob, as for slicing
+    where row i describes the blob labeled i+1. With batch=True, the
+    first axis indexes a stack of frames which are analyzed separately,
+    so blobs don't connect between frames, and the stats include
+    - 'frames':    the frame of each blob
+    """
+    labels, N = _labelBlobs(image, batch)
+    flat = labels.ravel()
+    areas = np.bincount(flat, minlength=N + 1)[1:]
+    centroids = np.empty((N, labels.ndim))
+    for ax, size in enumerate(labels.shape):
+        coords = np.arange(size).reshape((-1,) + (1,) * (labels.ndim - ax - 1))
+        coords = np.broadcast_to(coords, labels.shape).ravel()
+        centroids[:, ax] = np.bincount(flat, weights=coords, minlength=N + 1)[1:] / areas
+    boxes = scipy.ndimage.find_objects(labels)
+    starts = np.array([[sl.start for sl in box] for box in boxes], dtype=int).reshape((N, labels.ndim))
+    stops = np.array([[sl.stop for sl in box] for box in boxes], dtype=int).reshape((N, labels.ndim))
+    stats = {'labels': labels, 'areas': areas, 'centroids': centroids,
+             'starts': starts, 'stops': stops}
+    if batch:
+        stats['frames'] = starts[:, 0]
+    return stats
+
+def biggestBlob(image, batch=False):
+    """ Takes an image and returns a version with only the biggest continuous blob of non-zero elements left. With batch=True, the first axis indexes a stack of frames, and the biggest blob of each frame is kept. """
+    stats = blobStatistics(image, batch)
+    labels, areas = stats['labels'], stats['areas']
+    if not len(areas):
+        return np.zeros(labels.shape, dtype=bool)
+    if batch:
+        # the biggest (first, for ties) blob in each frame
+        order = np.lexsort((np.arange(len(areas)), -areas, stats['frames']))
+        first = np.r_[True, np.diff(stats['frames'][order]) != 0]
+        keep = np.zeros(len(areas) + 1, dtype=bool)
+        keep[order[first] + 1] = True
+        return keep[labels]
+    return labels == np.argmax(areas) + 1
+
+def binPixels(image, n=2, axes=(0, 1)):
+    """ Explicitly downsamples an image by an integer amount, by averaging adjacent pixels n-by-n. Odd pixels on the bottom and right are discarded. For stacks of images, give the image axes, for example axes=(-2, -1). """
+    image = np.asarray(image)
+    new = binArray(image, n, axes=axes, mean=True)
+    if issubclass(image.dtype.type, np.integer):
+        new = np.round(new)
+    return new.astype(image.dtype)
 
 def fastBinPixels(image, n=2):
     """ Downsamples an image by convolution followed by stride-tricks downsampling. """
@@ -106,38 +189,86 @@ def fastBinPixels(image, n=2):
 
     return image_downsampled
 
-def gaussian2D(n, sigma):
-    """ Returns an n-by-n matrix containing a circular 2d gaussian with variance sigma**2 in pixels. """
-    mat = np.zeros((n, n))
+def sumDtype(dtype, n):
+    """
+    Returns the dtype which holds sums of n values of dtype without
+    overflowing, widening integer types as needed. Sums which would
+    need more than 64 bits get the 64-bit type of the same signedness.
+    """
+    dtype = np.dtype(dtype)
+    if n <= 1 or dtype.kind not in 'biu':
+        return dtype
+    if dtype.kind == 'b':
+        return np.min_scalar_type(min(n, np.iinfo(np.uint64).max))
+    info = np.iinfo(dtype)
+    if dtype.kind == 'i':
+        extreme = max(int(info.min) * n, np.iinfo(np.int64).min)
+    else:
+        extreme = min(int(info.max) * n, np.iinfo(np.uint64).max)
+    return np.promote_types(dtype, np.min_scalar_type(extreme))
+
+def binArray(a, n=2, axes=(-2, -1), mean=False, dtype=None):
+    """
+    Bins an array in blocks of n pixels along the given axes, by default
+    the last two so that a whole stack of frames is binned at once. The
+    blocks are summed, or averaged with mean=True, and pixels left over
+    at the far edges are dropped.
+
+    n:     binning factor, or one factor per axis
+    dtype: output dtype, by default integer sums go into a type wide
+           enough not to overflow, see sumDtype()
+    """
+    a = np.asarray(a)
+    axes = [ax % a.ndim for ax in np.atleast_1d(axes)]
+    factors = [int(f) for f in np.broadcast_to(n, (len(axes),))]
+    shape, keep, blockAxes = [], [], []
+    for ax, size in enumerate(a.shape):
+        if ax in axes:
+            f = factors[axes.index(ax)]
+            shape += [size // f, f]
+            keep.append(slice(0, size // f * f))
+            blockAxes.append(len(shape) - 1)
+        else:
+            shape.append(size)
+            keep.append(slice(None))
+    blocks = a[tuple(keep)].reshape(shape)
+    if mean:
+        return blocks.mean(axis=tuple(blockAxes), dtype=dtype)
+    if dtype is None:
+        dtype = sumDtype(a.dtype, int(np.prod(factors)))
+    return blocks.sum(axis=tuple(blockAxes), dtype=dtype)
+
+@lru_cache(maxsize=32)
+def _gaussian2D(n, sigma):
     mu = (n - 1) / 2.0
     twoSigma2 = float(2 * sigma**2)
     prefactor = 1 / (twoSigma2 * np.pi)
-    for i in range(n):
-        for j in range(n):
-            mat[i, j] = prefactor * np.exp(- ((i - mu)**2 + (j - mu)**2) / twoSigma2 )
-            # the convolution darkens the image, not sure why, but this happens both with the scipy methods and
-            # with a slow manual doulbe loop convolution... this number was obtained from a numerical test.
-            mat[i, j] *= 100.0 / 77.9484
+    r2 = (np.arange(n) - mu)**2
+    mat = prefactor * np.exp(- (r2[:, None] + r2[None, :]) / twoSigma2)
+    # the convolution darkens the image, not sure why, but this happens both with the scipy methods and
+    # with a slow manual doulbe loop convolution... this number was obtained from a numerical test.
+    mat *= 100.0 / 77.9484
+    mat.setflags(write=False)
     return mat
-    
-def circle(n, radius=None, dtype='float'):
-    """ Returns an n-by-n array of zeros with a filled circle of ones in its center, with default radius n/2. """
-    result = np.zeros((n,n), dtype=dtype)
-    if not radius:
+
+def gaussian2D(n, sigma):
+    """ Returns an n-by-n matrix containing a circular 2d gaussian with variance sigma**2 in pixels. Kernels are cached by (n, sigma). """
+    return _gaussian2D(int(n), float(sigma)).copy()
+
+def _radii(n, radius):
+    """ Default radius n/2, and radius arrays shaped to broadcast against n-by-n frames. """
+    if radius is None or (np.ndim(radius) == 0 and not radius):
         radius = n / 2.0
-    I, J = result.shape
-    for i in range(I):
-        for j in range(J):
-            result[i, j] = int((i-(I-1)/2.0)**2 + (j-(J-1)/2.0)**2 < radius**2)
-    return result
+    return np.asarray(radius, dtype=float)[..., None, None]
+
+def circle(n, radius=None, dtype='float'):
+    """ Returns an n-by-n array of zeros with a filled circle of ones in its center, with default radius n/2. An array of radii gives a stack of circles. """
+    radius = _radii(n, radius)
+    x = np.arange(n) - (n - 1) / 2.0
+    return ((x[:, None]**2 + x[None, :]**2) < radius**2).astype(dtype)
     
 def pseudoCircle(n, radius=None, exponent=1.5, dtype='float'):
-    """ Returns an n-by-n array of zeros with a filled psuedo-circle of ones in its center, with default radius n/2. For exponent=1 this is a rhomb, for exponent=2 a circle, for high exponents a rounded-corner square."""
-    result = np.zeros((n,n), dtype=dtype)
-    if not radius:
-        radius = n / 2.0
-    I, J = result.shape
-    for i in range(I):
-        for j in range(J):
-            result[i, j] = int(  np.abs(i-(I-1)/2.0)**exponent + np.abs((j-(J-1)/2.0))**exponent < radius**exponent ) 
-    return result
+    """ Returns an n-by-n array of zeros with a filled psuedo-circle of ones in its center, with default radius n/2. For exponent=1 this is a rhomb, for exponent=2 a circle, for high exponents a rounded-corner square. An array of radii gives a stack of pseudo-circles."""
+    radius = _radii(n, radius)
+    x = np.abs(np.arange(n) - (n - 1) / 2.0)**exponent
+    return ((x[:, None] + x[None, :]) < radius**exponent).astype(dtype)
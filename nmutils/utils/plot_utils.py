@@ -1,41 +1,90 @@
 """ This file contains isolated helper functions and constants related to plotting. """
 
 from matplotlib.colors import LinearSegmentedColormap
-from colorsys import hsv_to_rgb, hls_to_rgb
 import numpy as np
 
-def complex2image(z, vmin=None, vmax=None, argmin=-np.pi, argmax=np.pi, offset=0.0, cmap='hsv'):
+def hsv2rgb(h, s, v):
+    """ Array version of colorsys.hsv_to_rgb, returns an (..., 3) array. Unlike colorsys, negative hues wrap around too. """
+    h, s, v = np.broadcast_arrays(h, s, v)
+    i = np.floor(h * 6.0)
+    f = h * 6.0 - i
+    i = np.mod(i, 6).astype(int)
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    rgb = np.empty(h.shape + (3,))
+    for k, comps in enumerate(((v, t, p), (q, v, p), (p, v, t),
+                               (p, q, v), (t, p, v), (v, p, q))):
+        mask = (i == k)
+        for c in range(3):
+            rgb[..., c][mask] = comps[c][mask]
+    return rgb
+
+def _hlsComponent(m1, m2, hue):
+    hue = np.mod(hue, 1.0)
+    return np.select([hue < 1/6., hue < .5, hue < 2/3.],
+                     [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (2/3. - hue) * 6.0],
+                     default=m1)
+
+def hls2rgb(h, l, s):
+    """ Array version of colorsys.hls_to_rgb, returns an (..., 3) array. """
+    h, l, s = np.broadcast_arrays(h, l, s)
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - l * s)
+    m1 = 2.0 * l - m2
+    rgb = np.stack([_hlsComponent(m1, m2, h + 1/3.),
+                    _hlsComponent(m1, m2, h),
+                    _hlsComponent(m1, m2, h - 1/3.)], axis=-1)
+    # colorsys gives gray for zero saturation
+    gray = (s == 0)
+    rgb[gray] = l[gray][:, None]
+    return rgb
+
+def complex2image(z, vmin=None, vmax=None, argmin=-np.pi, argmax=np.pi, offset=0.0, cmap='hsv',
+                  out=None, tile=None):
     """
     Combined theft from ptypy and stack overflow. The cmap kwarg can be 'hsv' or 'hls',
     where the latter goes from white (at vmin, lightness=1.0) to full color
     (at vmax, lightness=0.5). The offset argument rotates the hue over the [0,1]
     interval.
-    """
 
-    arg = np.angle(z)
-    s = np.ones(z.shape)
-    h = (arg.clip(argmin, argmax) - argmin) / (argmax - argmin) # [0, 1]
-    h += offset
-    
-    r = np.abs(z)
-    if vmin is None:
-        vmin = r.min()
-    if vmax is None:
-        vmax = r.max()
+    Returns an (m, n, 3) array of floats in [0, 1], or writes the image
+    into out, which can be a float RGB array or a uint8 RGB or RGBA
+    buffer, for example for display. With tile=k, k rows are colored at
+    a time to limit the memory used for intermediate arrays.
+    """
 
-    if cmap == 'hsv':
-        v = (r.clip(vmin, vmax) - vmin) / (vmax - vmin)
-        c = np.vectorize(hsv_to_rgb)(h,s,v) # tuple
-    elif cmap == 'hls':
-        l = (r.clip(vmin, vmax) - vmin) / (vmax - vmin) # [0, 1]
-        l = 1 - l * .5 # [1, .5]
-        c = np.vectorize(hls_to_rgb)(h,l,s) # tuple
-    else:
+    if cmap not in ('hsv', 'hls'):
         raise AttributeError('Invalid cmap, has to be hsv or hls.')
-    c = np.array(c)      # (3, m, n)
-    c = c.swapaxes(0, 2) # (n, m, 3)
-    c = c.swapaxes(0, 1) # (m, n, 3)
-    return c
+    z = np.asarray(z)
+    if out is None:
+        out = np.empty(z.shape + (3,))
+    tile = tile or max(1, z.shape[0])
+
+    if vmin is None or vmax is None:
+        rmin, rmax = np.inf, -np.inf
+        for i in range(0, z.shape[0], tile):
+            r = np.abs(z[i:i + tile])
+            rmin, rmax = min(rmin, r.min()), max(rmax, r.max())
+        vmin = rmin if vmin is None else vmin
+        vmax = rmax if vmax is None else vmax
+
+    for i in range(0, z.shape[0], tile):
+        block = z[i:i + tile]
+        h = (np.angle(block).clip(argmin, argmax) - argmin) / (argmax - argmin) # [0, 1]
+        h += offset
+        x = (np.abs(block).clip(vmin, vmax) - vmin) / (vmax - vmin)
+        if cmap == 'hsv':
+            c = hsv2rgb(h, 1.0, x)
+        else:
+            c = hls2rgb(h, 1 - x * .5, 1.0) # lightness [1, .5]
+        dst = out[i:i + tile]
+        if out.dtype == np.uint8:
+            dst[..., :3] = np.round(c * 255)
+            if out.shape[-1] == 4:
+                dst[..., 3] = 255
+        else:
+            dst[..., :3] = c
+    return out
     
 # constants
 alpha2red = LinearSegmentedColormap('alpha2red', 
@@ -1,76 +1,76 @@
 """ Isolated helper functions related to coherent wavefront propagation. """
 
 import numpy as np
+from . import fft_utils
 
-try:
-    import pyfftw
-except:
-    pass
-
-# at this point, with a 300x300 image, FFTW is about twice as fast as numpy. Threading doesn't help at this point. 
-# FFTW can be improved using the pyfftw.FFTW class or the pyfftw.builders functions.
 def fft(a):
-    #a = np.fft.fftn(a)
-    a = pyfftw.interfaces.numpy_fft.fftn(a, threads=1)
-    a = np.fft.fftshift(a)
-    return a
+    """ Centered N-dimensional FFT, see fft_utils for the backend. """
+    return np.fft.fftshift(fft_utils.fftn(a))
     
 def ifft(a):
-    a = np.fft.ifftshift(a)
-    a = pyfftw.interfaces.numpy_fft.ifftn(a, threads=1)
-    #a = np.fft.ifftn(a)
-    return a
+    """ Inverse of fft(). """
+    return fft_utils.ifftn(np.fft.ifftshift(a))
+
+# photon wavelength (m) times energy (keV)
+HC = 1.23984198e-9
+
+def _nearfieldPhase(shape, psize, energy):
+    """
+    The phase per unit distance of the angular spectrum transfer
+    function, in unshifted FFT order, leaving out the plane wave term.
+    Evanescent components are cut, so as not to blow up when
+    propagating backwards.
+    """
+    lam = HC / energy
+    qy = np.fft.fftfreq(shape[0], psize)
+    qx = np.fft.fftfreq(shape[1], psize)
+    a2 = lam**2 * (qy[:, None]**2 + qx[None, :]**2)
+    propagating = a2 < 1
+    # 2pi/lam * (sqrt(1 - a2) - 1), written so as to be accurate for small a2
+    kz = -2 * np.pi / lam * a2 / (1 + np.sqrt(np.where(propagating, 1 - a2, 1)))
+    return kz, propagating
+
+def iterNearfield(A, psize, distances, energy, chunk=None):
+    """
+    Generator version of propagateNearfield(), which yields (slice,
+    planes) pairs with chunk planes at a time, so that long caustics
+    can be processed without holding all planes in memory. The default
+    chunk gives some 64 MiB per chunk.
+    """
+    A = np.asarray(A)
+    distances = np.atleast_1d(distances).astype(float)
+    dtype = np.result_type(A.dtype, np.complex64)
+    kz, propagating = _nearfieldPhase(A.shape, psize, energy)
+    # the spectrum of the wavefront is only calculated once
+    spectrum = fft_utils.fft2(A) * propagating
+    chunk = chunk or max(1, (1 << 26) // (A.size * 16))
+    for i in range(0, len(distances), chunk):
+        sl = slice(i, min(i + chunk, len(distances)))
+        kernels = np.exp(1j * distances[sl, None, None] * kz[None])
+        yield sl, fft_utils.ifft2(spectrum[None] * kernels).astype(dtype, copy=False)
 
-def propagateNearfield(A, psize, distances, energy):     
+def propagateNearfield(A, psize, distances, energy, chunk=None):
 
     """           
-    Propagates the complex wavefront in N-by-N ndarray to the plane(s)
+    Propagates the complex wavefront in N-by-M ndarray to the plane(s)
     specified as distances. The physical spacing of array elements is 
     psize, and the beam energy is specified in keV. An array 
-    length(distances) x N x N is returned.
+    length(distances) x N x M is returned.
 
-    The underlying code is ptypy's Geo class, which is essentially
-    wrapped here.
+    This is an angular spectrum propagator, equivalent to ptypy's
+    near-field propagator, where the transfer functions of chunk
+    planes at a time are built and applied together, see
+    iterNearfield().
     """
 
-    import ptypy
-    from distutils.version import LooseVersion
-    if LooseVersion(ptypy.version) < LooseVersion('0.3.0'):
-        raise Exception('This script requires ptypy 0.3.0 or newer')
-
-    # check for square matrix
+    # check for 2D matrix
     try:
-        assert len(A.shape) == 2
-        assert A.shape[0] == A.shape[1]
+        assert len(np.shape(A)) == 2
     except AssertionError:
-        raise RuntimeError("Wavefront array must be N x N")
-
-    # passing a single distance is allowed too
-    try:
-        len(distances)
-    except TypeError:
-        distances = [distances]
-
-    # parameters for the propagator
-    geo_pars = ptypy.core.geometry.Geo.DEFAULT.copy(depth=10)
-    geo_pars.energy = energy
-    geo_pars.distance = distances[0]
-    geo_pars.resolution = psize
-    geo_pars.psize = psize
-    geo_pars.shape = A.shape[0]
-    geo_pars.propagation = 'nearfield'
-
-    # create the propagator
-    geo = ptypy.core.geometry.Geo(pars=geo_pars)
-
-    # prepare a 3D matrix for propagated wavefronts
-    N = len(distances)
-    result = np.zeros((N,) + A.shape, dtype=A.dtype)
-
-    # iterate over the distances and propagate to there
-    for i in range(N):
-        geo.p.distance = distances[i]
-        geo.update()
-        result[i, :, :] = geo.propagator.fw(A)
+        raise RuntimeError("Wavefront array must be N x M")
 
+    distances = np.atleast_1d(distances)
+    result = np.empty((len(distances),) + np.shape(A), dtype=np.result_type(np.asarray(A).dtype, np.complex64))
+    for sl, planes in iterNearfield(A, psize, distances, energy, chunk):
+        result[sl] = planes
     return result
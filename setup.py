@@ -5,5 +5,5 @@ setup(
     version = "0.1a0",
     packages = find_packages(),
     install_requires = ['numpy', 'h5py', 'silx>=0.11'],
-    scripts = ['apps/scanViewer', 'apps/ptychoViewer', 'apps/limaLiveViewer', 'apps/fluxMonitor.py'],
+    scripts = ['apps/scanViewer', 'apps/ptychoViewer', 'apps/limaLiveViewer', 'apps/fluxMonitor.py', 'apps/dpcMaps.py'],
     )